@@ -0,0 +1,362 @@
+from machine import Pin
+from array import array
+from compat import MICROPYTHON, micropython, ticks_ms, ticks_us, ticks_diff, sleep_ms
+from fastpath import frame_id, store_frame
+from j1939_tp import TP_CM, TP_DT
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+
+class FrameRing:
+    """Buffer circular pré-alocado para quadros CAN capturados"""
+    # Cada posição guarda o quadro no formato do MCP2515:
+    # SIDH, SIDL, EID8, EID0, DLC, D0..D7
+    SLOT_SIZE = 13
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.raw = bytearray(capacity * self.SLOT_SIZE)
+        self.stamps = array('I', bytearray(4 * capacity))
+        self.head = 0  # Próxima posição de escrita (só o produtor altera)
+        self.tail = 0  # Próxima posição de leitura (só o consumidor altera)
+        self.dropped = 0  # Quadros descartados com o buffer cheio
+        self.high_water = 0  # Maior ocupação observada
+
+    def __len__(self):
+        return (self.head - self.tail) % self.capacity
+
+    def push(self, raw, timestamp):
+        """Adiciona um quadro; retorna False se o buffer estiver cheio"""
+        head = self.head
+        nxt = (head + 1) % self.capacity
+        if nxt == self.tail:
+            self.dropped += 1
+            return False
+        store_frame(self.raw, head, raw)
+        self.stamps[head] = timestamp
+        self.head = nxt
+        used = (nxt - self.tail) % self.capacity
+        if used > self.high_water:
+            self.high_water = used
+        return True
+
+    def peek(self):
+        """Índice do quadro mais antigo ou -1 se vazio"""
+        if self.tail == self.head:
+            return -1
+        return self.tail
+
+    def view(self, index):
+        """Memoryview do quadro na posição indicada (sem cópia)"""
+        start = index * self.SLOT_SIZE
+        return memoryview(self.raw)[start:start + self.SLOT_SIZE]
+
+    def release(self):
+        """Libera a posição lida por peek()"""
+        if self.tail != self.head:
+            self.tail = (self.tail + 1) % self.capacity
+
+
+class CANCapture:
+    """Captura quadros do MCP2515
+
+    Modos:
+    - 'irq': borda de descida do pino INT agenda drain() via micropython.schedule
+    - 'thread': laço dedicado em _thread drena o MCP2515 e, sem quadros
+      pendentes, fica bloqueado em um lock liberado pela IRQ do pino INT
+      (a espera solta o GIL); o buffer circular e o barramento SPI ficam
+      protegidos por outro lock
+
+    No port ESP32 padrão as threads do MicroPython compartilham o núcleo
+    e o GIL do interpretador (a pilha WiFi roda no outro núcleo); o modo
+    'thread' isola a captura das pausas da rede, e capture_benchmark.py
+    compara os dois modos.
+    """
+    RX_OVERFLOW = 0xC0  # RX1OVR | RX0OVR
+
+    def __init__(self, can, capacity=256, max_batch=16):
+        self.can = can
+        self.ring = FrameRing(capacity)
+        self.max_batch = max_batch
+
+        # Contadores
+        self.captured = 0
+        self.filtered = 0  # Rejeitados pelo filtro por software
+        self.overflows = 0  # Overflow no próprio MCP2515 (RXnOVR)
+        self.irq_count = 0
+        self.schedule_failures = 0  # Fila do micropython.schedule cheia
+        self.bus_bits = 0  # Bits nominais dos quadros recebidos (sem bit stuffing)
+        self.error_flags = 0  # OU dos valores de EFLG lidos na drenagem
+        
+        # Tempo das rodadas de drenagem (leituras SPI)
+        self.drain_rounds = 0
+        self.drain_frames = 0
+        self.drain_us = 0
+        self.max_drain_us = 0
+
+        # Filtros de PGN (None = aceita tudo)
+        self.filter_pgns = None
+        self.software_filter = None
+
+        # Latência entre captura e transferência para o histórico
+        self.max_latency_ms = 0
+        self.first_frame_ms = None  # Tempo do boot ao primeiro quadro
+
+        # Remontagem do transporte J1939 (None = TP.CM/TP.DT vão crus ao histórico)
+        self.tp = None
+        # Tabela de últimos valores por (PGN, origem) (None = desativada)
+        self.table = None
+
+        self.mode = None
+        self.lock = None
+        self._wake = None  # Lock liberado pela IRQ para acordar a thread
+        self.running = False
+        self._thread_done = True
+        self._pending = False
+        # Referências pré-alocadas: o handler da IRQ não deve alocar memória
+        self._drain_ref = self.drain
+        self._irq_ref = self._irq
+        self._wake_ref = self._wake_irq
+
+    def start(self, mode='irq'):
+        """Inicia a captura no modo 'irq' ou 'thread'"""
+        self.mode = mode
+        if mode == 'thread':
+            self.lock = _thread.allocate_lock()
+            self._wake = _thread.allocate_lock()
+            self._wake.acquire()
+            self.running = True
+            self._thread_done = False
+            self.can.int_pin.irq(trigger=Pin.IRQ_FALLING, handler=self._wake_ref)
+            _thread.start_new_thread(self._thread_loop, ())
+        else:
+            self.can.int_pin.irq(trigger=Pin.IRQ_FALLING, handler=self._irq_ref)
+            # Quadros recebidos antes da IRQ estar ativa mantêm INT em nível baixo
+            self.drain()
+
+    def stop(self):
+        """Desabilita a captura"""
+        if self.mode == 'thread':
+            self.running = False
+            self.can.int_pin.irq(handler=None)
+            # Acorda a thread e aguarda o laço terminar (sleep_ms solta o GIL)
+            self._wake_irq(None)
+            while not self._thread_done:
+                sleep_ms(1)
+            self.lock = None
+            self._wake = None
+        else:
+            self.can.int_pin.irq(handler=None)
+        self.mode = None
+
+    def _thread_loop(self):
+        can = self.can
+        wake = self._wake
+        while self.running:
+            if can.int_pin.value() == 0:
+                self.drain()
+            else:
+                # Bloqueia sem ocupar a CPU até a próxima borda de INT; uma
+                # borda entre o teste acima e o acquire já deixou o lock livre
+                wake.acquire()
+        self._thread_done = True
+
+    def _wake_irq(self, pin):
+        try:
+            self._wake.release()
+        except RuntimeError:  # Já liberado: a thread ainda não voltou a esperar
+            pass
+
+    def _irq(self, pin):
+        self.irq_count += 1
+        if self._pending:
+            return
+        self._pending = True
+        try:
+            micropython.schedule(self._drain_ref, None)
+        except RuntimeError:
+            self._pending = False
+            self.schedule_failures += 1
+
+    def drain(self, _=None):
+        """Esvazia o MCP2515 para o buffer circular"""
+        self._pending = False
+        if self.lock:
+            with self.lock:
+                return self._drain()
+
+        count = self._drain()
+
+        # INT continua baixo: não haverá nova borda, agenda outra rodada
+        if self.can.int_pin.value() == 0 and not self._pending and MICROPYTHON:
+            self._pending = True
+            try:
+                micropython.schedule(self._drain_ref, None)
+            except RuntimeError:
+                self._pending = False
+                self.schedule_failures += 1
+
+        return count
+
+    def _drain(self):
+        can = self.can
+        count = 0
+        start = ticks_us()
+
+        while can.int_pin.value() == 0 and count < self.max_batch:
+            status = can.read_rx_status()
+            if not status:
+                break
+            # Com rollover, RXB0 sempre contém o quadro mais antigo
+            if status & can.RX0IF:
+                self._store(can.read_rx_into(0))
+                count += 1
+            if status & can.RX1IF:
+                self._store(can.read_rx_into(1))
+                count += 1
+
+        if count:
+            eflg = can.read_register(can.EFLG)
+            self.error_flags |= eflg
+            if eflg & self.RX_OVERFLOW:
+                self.overflows += 1
+                can.write_register(can.EFLG, 0)
+
+            elapsed = ticks_diff(ticks_us(), start)
+            self.drain_rounds += 1
+            self.drain_frames += count
+            self.drain_us += elapsed
+            if elapsed > self.max_drain_us:
+                self.max_drain_us = elapsed
+
+        return count
+
+    def poll(self):
+        """Drena se INT estiver baixo sem rodada agendada (borda perdida)"""
+        if self.mode == 'irq' and not self._pending and self.can.int_pin.value() == 0:
+            return self.drain()
+        return 0
+
+    @micropython.native
+    def transfer(self, history):
+        """Move quadros do buffer circular para o histórico"""
+        ring = self.ring
+        lock = self.lock
+        count = 0
+        if lock:
+            lock.acquire()
+        try:
+            index = ring.peek()
+            if index >= 0:
+                latency = ticks_diff(ticks_ms(), ring.stamps[index])
+                if latency > self.max_latency_ms:
+                    self.max_latency_ms = latency
+            tp = self.tp
+            table = self.table
+            raw = ring.raw
+            stamps = ring.stamps
+            while index >= 0:
+                # Quadro lido direto do buffer circular (sem memoryview por quadro)
+                start = index * FrameRing.SLOT_SIZE
+                if raw[start + 1] & 0x08:  # Apenas IDs estendidos (J1939)
+                    can_id = frame_id(raw, start)
+                    pf = (can_id >> 16) & 0xFF
+                    if tp and (pf == TP_CM or pf == TP_DT):
+                        tp.process(can_id, ring.view(index)[5:13], stamps[index])
+                    else:
+                        seq = history.append_raw(can_id, raw, stamps[index], start)
+                        if table is not None:
+                            table.update_raw(can_id, raw, stamps[index], seq, start)
+                        count += 1
+                ring.release()
+                index = ring.peek()
+        finally:
+            if lock:
+                lock.release()
+        if tp and tp.active:
+            tp.expire(ticks_ms())
+        return count
+
+    @micropython.native
+    def _store(self, buffer):
+        # Quadro estendido: 67 bits de controle + 8 por byte de dados
+        self.bus_bits += 67 + 8 * min(buffer[4] & 0x0F, 8)
+        software_filter = self.software_filter
+        if software_filter and not (buffer[1] & 0x08 and software_filter.match(frame_id(buffer, 0))):
+            self.filtered += 1
+            return
+        stamp = ticks_ms()
+        if self.ring.push(buffer, stamp):
+            self.captured += 1
+            if self.first_frame_ms is None:
+                self.first_frame_ms = stamp  # ticks_ms conta desde o boot
+
+    def _suspend(self):
+        """Impede drenagens enquanto o SPI é usado fora da captura"""
+        if self.lock:
+            self.lock.acquire()
+        elif self.mode == 'irq':
+            self.can.int_pin.irq(handler=None)
+
+    def _resume(self):
+        if self.lock:
+            self.lock.release()
+        elif self.mode == 'irq':
+            self.can.int_pin.irq(trigger=Pin.IRQ_FALLING, handler=self._irq_ref)
+            self.drain()
+
+    def read_controller_state(self):
+        """Lê TEC/REC/EFLG do MCP2515 sem disputar o SPI com a captura"""
+        self._suspend()
+        try:
+            return self.can.read_error_state()
+        finally:
+            self._resume()
+
+    def set_filters(self, pgns, sources=None):
+        """Aceita apenas os PGNs informados (lista vazia = todos)"""
+        # Nenhuma drenagem pode usar o SPI enquanto os filtros são gravados
+        self._suspend()
+        try:
+            if pgns:
+                accepted = list(pgns)
+                if self.tp:
+                    # Mensagens longas dos PGNs filtrados chegam via TP.CM/TP.DT
+                    accepted += [TP_CM << 8, TP_DT << 8]
+                self.software_filter = self.can.set_pgn_filters(accepted, sources)
+                self.filter_pgns = sorted(pgns)
+            else:
+                self.can.clear_filters()
+                self.software_filter = None
+                self.filter_pgns = None
+        finally:
+            self._resume()
+        return {
+            'pgns': self.filter_pgns,
+            'hardware_exact': self.filter_pgns is not None and self.software_filter is None
+        }
+
+    def get_stats(self):
+        """Retorna contadores da captura"""
+        return {
+            'captured': self.captured,
+            'dropped': self.ring.dropped,
+            'filtered': self.filtered,
+            'overflows': self.overflows,
+            'pending': len(self.ring),
+            'capacity': self.ring.capacity,
+            'mode': self.mode,
+            'max_latency_ms': self.max_latency_ms,
+            'first_frame_ms': self.first_frame_ms,
+            'irq_count': self.irq_count,
+            'schedule_failures': self.schedule_failures,
+            'high_water': self.ring.high_water,
+            'bus_bits': self.bus_bits,
+            'error_flags': self.error_flags,
+            'drain_rounds': self.drain_rounds,
+            'drain_us_per_frame': self.drain_us // self.drain_frames if self.drain_frames else 0,
+            'max_drain_us': self.max_drain_us
+        }
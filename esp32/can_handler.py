@@ -1,6 +1,139 @@
 from machine import SPI, Pin
 import time
 
+# Máscaras de identificador J1939 (29 bits)
+PDU1_MASK = 0x03FF0000  # EDP, DP, PF (PS é o endereço de destino)
+PDU2_MASK = 0x03FFFF00  # EDP, DP, PF, PS
+SOURCE_MASK = 0x000000FF
+
+def j1939_pgn(can_id):
+    """Extrai o PGN do identificador (PS zerado em PDU1)"""
+    pgn = (can_id >> 8) & 0x3FFFF
+    if (pgn >> 8) & 0xFF < 240:
+        pgn &= 0x3FF00
+    return pgn
+
+def plan_filters(pgns, sources=None):
+    """Distribui PGNs nos 6 filtros e 2 máscaras do MCP2515
+    
+    Retorna (máscaras, filtros, exato) ou None se não couber no hardware.
+    RXM0 atende RXF0-RXF1 (RXB0) e RXM1 atende RXF2-RXF5 (RXB1).
+    """
+    entries = []
+    for pgn in sorted(set(pgns)):
+        mask = PDU2_MASK if (pgn >> 8) & 0xFF >= 240 else PDU1_MASK
+        if sources:
+            for source in sorted(set(sources)):
+                entries.append((mask | SOURCE_MASK, (pgn << 8) | source))
+        else:
+            entries.append((mask, pgn << 8))
+    if not entries or len(entries) > 6:
+        return None
+    
+    groups = {}
+    for mask, can_id in entries:
+        groups.setdefault(mask, []).append(can_id)
+    
+    exact = True
+    if len(groups) == 1:
+        mask = entries[0][0]
+        rxb0, rxb1 = (mask, groups[mask][:2]), (mask, groups[mask][2:])
+    elif len(groups) == 2:
+        (mask_a, ids_a), (mask_b, ids_b) = sorted(groups.items(), key=lambda g: len(g[1]))
+        if len(ids_a) <= 2 and len(ids_b) <= 4:
+            rxb0, rxb1 = (mask_a, ids_a), (mask_b, ids_b)
+        else:
+            rxb0 = None
+    else:
+        rxb0 = None
+    
+    if rxb0 is None:
+        # Máscara comum menos seletiva; o software completa a filtragem
+        exact = False
+        mask = PDU2_MASK | SOURCE_MASK
+        for entry_mask, _ in entries:
+            mask &= entry_mask
+        ids = sorted(set(can_id & mask for _, can_id in entries))
+        rxb0, rxb1 = (mask, ids[:2]), (mask, ids[2:])
+    
+    # Filtros sem uso repetem um filtro válido do mesmo buffer
+    if not rxb1[1]:
+        rxb1 = (rxb0[0], rxb0[1])
+    filters = [rxb0[1][i % len(rxb0[1])] for i in range(2)]
+    filters += [rxb1[1][i % len(rxb1[1])] for i in range(4)]
+    return (rxb0[0], rxb1[0]), filters, exact
+
+
+class J1939Frame:
+    """Quadro J1939 compacto (sem dict por quadro)
+    
+    Guarda apenas o ID de 29 bits, os dados e o timestamp; os campos J1939
+    são derivados do ID sob demanda e a formatação em texto fica para a
+    serialização (to_dict).
+    """
+    __slots__ = ('can_id', 'data', 'timestamp')
+    
+    def __init__(self, can_id, data, timestamp):
+        self.can_id = can_id
+        self.data = data
+        self.timestamp = timestamp
+    
+    @property
+    def priority(self):
+        return (self.can_id >> 26) & 0x07
+    
+    @property
+    def data_page(self):
+        return (self.can_id >> 24) & 0x01
+    
+    @property
+    def pdu_format(self):
+        return (self.can_id >> 16) & 0xFF
+    
+    @property
+    def pdu_specific(self):
+        return (self.can_id >> 8) & 0xFF
+    
+    @property
+    def pgn(self):
+        return j1939_pgn(self.can_id)
+    
+    @property
+    def source(self):
+        return self.can_id & 0xFF
+    
+    @property
+    def destination(self):
+        """Endereço de destino (PDU1) ou 0xFF (global, PDU2)"""
+        if self.pdu_format < 240:
+            return self.pdu_specific
+        return 0xFF
+    
+    def to_dict(self):
+        """Representação JSON (formatação adiada até a serialização)"""
+        return {
+            "id": f"0x{self.can_id:08X}",
+            "pgn": f"0x{self.pgn:04X}",
+            "data": list(self.data),
+            "timestamp": self.timestamp,
+            "source": self.source,
+            "destination": self.destination,
+            "priority": self.priority
+        }
+
+
+class PGNFilter:
+    """Filtro por software para PGNs que não cabem nos filtros do MCP2515"""
+    def __init__(self, pgns, sources=None):
+        self.pgns = set(pgns)
+        self.sources = set(sources) if sources else None
+    
+    def match(self, can_id):
+        if j1939_pgn(can_id) not in self.pgns:
+            return False
+        return self.sources is None or (can_id & 0xFF) in self.sources
+
+
 class MCP2515:
     # Registradores MCP2515
     CNF1 = 0x2A
@@ -11,13 +144,42 @@ class MCP2515:
     RXB0CTRL = 0x60
     RXB0SIDH = 0x61
     RXB0D0 = 0x66
+    RXB1CTRL = 0x70
+    RXF_SIDH = (0x00, 0x04, 0x08, 0x10, 0x14, 0x18)  # RXF0..RXF5
+    RXM_SIDH = (0x20, 0x24)  # RXM0, RXM1
+    # CNF1, CNF2, CNF3 por taxa (cristal de 8 MHz, TQ = 2 * (BRP + 1) / 8 MHz)
+    # Bit = sync + PRSEG + PHSEG1 + PHSEG2; amostragem perto dos 87,5% do J1939
+    CNF_8MHZ = {
+        125000: (0x01, 0xB5, 0x01),  # 16 TQ de 500 ns: 1+6+7+2, amostra em 87,5%
+        250000: (0x00, 0xB5, 0x01),  # 16 TQ de 250 ns: 1+6+7+2, amostra em 87,5%
+        500000: (0x00, 0x91, 0x01)   # 8 TQ de 250 ns: 1+2+3+2, amostra em 75%
+    }
+    TEC = 0x1C  # Contador de erros de transmissão
+    REC = 0x1D  # Contador de erros de recepção
+    EFLG = 0x2D
+    
+    # Bits e instruções SPI
+    BUKT = 0x04  # Rollover de RXB0 para RXB1
+    RX0IF = 0x01
+    RX1IF = 0x02
+    READ_STATUS = b'\xA0'
+    # READ RX BUFFER a partir de RXBnSIDH; limpa RXnIF ao subir o CS
+    READ_RX = (b'\x90', b'\x94')
     
-    def __init__(self, spi_bus=2, cs_pin=5, int_pin=4):
+    def __init__(self, spi_bus=2, cs_pin=5, int_pin=4, bitrate=250000):
         """Inicializa o MCP2515"""
         self.cs = Pin(cs_pin, Pin.OUT)
         self.cs.value(1)  # CS é ativo baixo
         
         self.int_pin = Pin(int_pin, Pin.IN)
+        self.mode = None
+        self.bitrate = None  # Usado na estimativa de carga do barramento
+        
+        # Buffers pré-alocados: leituras por quadro não alocam memória
+        self.rx_buf = bytearray(13)  # SIDH, SIDL, EID8, EID0, DLC, D0..D7
+        self._reg_buf = bytearray(3)
+        self._read_buf = bytearray(2)
+        self._byte_buf = bytearray(1)
         
         # Configurar SPI
         self.spi = SPI(spi_bus, baudrate=10000000, polarity=0, phase=0)
@@ -26,12 +188,15 @@ class MCP2515:
         self.reset()
         time.sleep_ms(100)
         
-        # Configurar para 250kbps
-        self.set_baud_rate()
+        # Configurar taxa do barramento
+        self.set_baud_rate(bitrate)
         
         # Configurar filtros para J1939
         self.setup_filters()
         
+        # Habilita interrupções de recepção (INT vai a nível baixo)
+        self.write_register(self.CANINTE, 0x03)  # RX0IE | RX1IE
+        
         # Configurar modo normal
         self.set_mode('normal')
         
@@ -54,76 +219,127 @@ class MCP2515:
             return
             
         self.write_register(0x0F, modes[mode])  # CANCTRL register
+        self.mode = mode
+        
+    def set_baud_rate(self, bitrate=250000):
+        """Configura a taxa do barramento (125, 250 ou 500 kbps)"""
+        if bitrate not in self.CNF_8MHZ:
+            print(f"Taxa CAN {bitrate} não suportada, usando 250 kbps")
+            bitrate = 250000
         
-    def set_baud_rate(self):
-        """Configura baudrate para 250kbps"""
         # Coloca em modo configuração
         self.set_mode('config')
         
-        # Configurações para 250kbps com clock 8MHz
-        self.write_register(self.CNF1, 0x00)
-        self.write_register(self.CNF2, 0x90)
-        self.write_register(self.CNF3, 0x02)
+        cnf1, cnf2, cnf3 = self.CNF_8MHZ[bitrate]
+        self.write_register(self.CNF1, cnf1)
+        self.write_register(self.CNF2, cnf2)
+        self.write_register(self.CNF3, cnf3)
+        self.bitrate = bitrate
         
     def setup_filters(self):
         """Configura filtros para J1939"""
         # Aceita todas as mensagens J1939 (PGN)
-        self.write_register(self.RXB0CTRL, 0x60)  # Recebe todas as mensagens
+        # RXB0 transborda para RXB1 quando cheio (BUKT)
+        self.write_register(self.RXB0CTRL, 0x60 | self.BUKT)  # Recebe todas as mensagens
+        self.write_register(self.RXB1CTRL, 0x60)
+        
+    def write_id(self, addr, can_id, extended=True):
+        """Escreve um ID de 29 bits no formato SIDH/SIDL/EID8/EID0"""
+        sidl = ((can_id >> 13) & 0xE0) | ((can_id >> 16) & 0x03)
+        if extended:
+            sidl |= 0x08  # EXIDE: filtro só aceita quadros estendidos
+        self.cs.value(0)
+        self.spi.write(bytes([0x02, addr, (can_id >> 21) & 0xFF, sidl,
+                              (can_id >> 8) & 0xFF, can_id & 0xFF]))
+        self.cs.value(1)
+        
+    def set_pgn_filters(self, pgns, sources=None):
+        """Programa filtros e máscaras para os PGNs (e origens) informados
+        
+        Retorna um PGNFilter quando o hardware não consegue filtrar com
+        exatidão (mais PGNs que filtros), ou None se o hardware basta.
+        """
+        plan = plan_filters(pgns, sources)
+        mode = self.mode
+        self.set_mode('config')
+        
+        if plan is None:
+            # Sem filtros suficientes: recebe tudo e filtra por software
+            self.setup_filters()
+        else:
+            masks, filters, exact = plan
+            for addr, mask in zip(self.RXM_SIDH, masks):
+                self.write_id(addr, mask, extended=False)
+            for addr, can_id in zip(self.RXF_SIDH, filters):
+                self.write_id(addr, can_id)
+            # RXM = 00: aplica filtros e máscaras
+            self.write_register(self.RXB0CTRL, self.BUKT)
+            self.write_register(self.RXB1CTRL, 0x00)
+        
+        if mode:
+            self.set_mode(mode)
+        
+        if plan is None or not plan[2]:
+            return PGNFilter(pgns, sources)
+        return None
+        
+    def clear_filters(self):
+        """Volta a receber todas as mensagens"""
+        mode = self.mode
+        self.set_mode('config')
+        self.setup_filters()
+        if mode:
+            self.set_mode(mode)
         
     def write_register(self, addr, value):
         """Escreve em um registro"""
+        buf = self._reg_buf
+        buf[0] = 0x02  # Write command
+        buf[1] = addr
+        buf[2] = value
         self.cs.value(0)
-        self.spi.write(bytes([0x02, addr, value]))  # Write command
+        self.spi.write(buf)
         self.cs.value(1)
         
     def read_register(self, addr):
         """Lê um registro"""
+        buf = self._read_buf
+        buf[0] = 0x03  # Read command
+        buf[1] = addr
         self.cs.value(0)
-        self.spi.write(bytes([0x03, addr]))  # Read command
-        result = self.spi.read(1)
+        self.spi.write(buf)
+        self.spi.readinto(self._byte_buf)
         self.cs.value(1)
-        return result[0]
+        return self._byte_buf[0]
         
-    def read_rx_buffer(self):
-        """Lê buffer de recepção"""
+    def read_rx_status(self):
+        """Lê flags RX0IF/RX1IF com a instrução READ STATUS"""
         self.cs.value(0)
-        self.spi.write(bytes([0x90]))  # Read RX buffer command
-        data = self.spi.read(13)  # Lê ID + DLC + 8 bytes de dados
+        self.spi.write(self.READ_STATUS)
+        self.spi.readinto(self._byte_buf)
         self.cs.value(1)
-        return data
-        
-    def parse_j1939_message(self, buffer):
-        """Converte buffer em mensagem J1939"""
-        if not buffer or len(buffer) < 13:
-            return None
-            
-        # Extrai ID e PGN
-        id_high = buffer[0]
-        id_low = buffer[1]
-        can_id = (id_high << 8) | id_low
-        pgn = (can_id >> 8) & 0x1FFFF
+        return self._byte_buf[0] & (self.RX0IF | self.RX1IF)
         
-        # Extrai dados
-        dlc = buffer[4] & 0x0F
-        data = list(buffer[5:5+dlc])
+    def read_rx_into(self, index):
+        """Lê RXB0 ou RXB1 para o buffer pré-alocado rx_buf"""
+        self.cs.value(0)
+        self.spi.write(self.READ_RX[index])
+        self.spi.readinto(self.rx_buf)
+        self.cs.value(1)  # Flag RXnIF é limpa pelo próprio MCP2515
+        return self.rx_buf
         
+    def read_error_state(self):
+        """Contadores TEC/REC e flags de erro do EFLG"""
+        eflg = self.read_register(self.EFLG)
         return {
-            "pgn": f"0x{pgn:04X}",
-            "data": data,
-            "timestamp": time.ticks_ms(),
-            "source": can_id & 0xFF,
-            "priority": (can_id >> 26) & 0x7
+            'tec': self.read_register(self.TEC),
+            'rec': self.read_register(self.REC),
+            'eflg': eflg,
+            'rx1_overflow': bool(eflg & 0x80),
+            'rx0_overflow': bool(eflg & 0x40),
+            'bus_off': bool(eflg & 0x20),
+            'tx_error_passive': bool(eflg & 0x10),
+            'rx_error_passive': bool(eflg & 0x08),
+            'tx_warning': bool(eflg & 0x04),
+            'rx_warning': bool(eflg & 0x02)
         }
-        
-    def read_message(self):
-        """Lê mensagem CAN se disponível"""
-        if self.int_pin.value() == 0:  # Mensagem disponível
-            buffer = self.read_rx_buffer()
-            message = self.parse_j1939_message(buffer)
-            
-            # Limpa flag de interrupção
-            self.write_register(self.CANINTF, 0)
-            
-            return message
-            
-        return None 
\ No newline at end of file
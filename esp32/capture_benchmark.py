@@ -0,0 +1,74 @@
+# Compara a captura CAN em núcleo único (IRQ) e em _thread dedicada
+#
+# Uso (com o barramento ativo):
+#     mpremote run esp32/capture_benchmark.py
+#
+# Cada modo roda por DURATION_S segundos com uma carga de rede simulada
+# (serialização JSON de lotes, como no WebSocket) e informa quadros
+# capturados por segundo, descartes, overflows do MCP2515 e a maior
+# latência entre captura e histórico.
+import asyncio
+import gc
+import json
+import time
+from can_handler import MCP2515
+from can_capture import CANCapture
+from frame_history import FrameHistory
+
+DURATION_S = 10
+MODES = ('irq', 'thread')
+
+
+async def transfer_loop(capture, history):
+    while True:
+        capture.transfer(history)
+        capture.poll()
+        await asyncio.sleep_ms(10)
+
+
+async def network_load(history):
+    """Simula o trabalho do servidor web serializando lotes de quadros"""
+    while True:
+        json.dumps([frame.to_dict() for _, frame in history.frames(limit=50)])
+        await asyncio.sleep_ms(20)
+
+
+async def measure(can, mode, seconds):
+    gc.collect()
+    capture = CANCapture(can)
+    history = FrameHistory(1000)
+    capture.start(mode)
+    start = time.ticks_ms()
+    tasks = [
+        asyncio.create_task(transfer_loop(capture, history)),
+        asyncio.create_task(network_load(history))
+    ]
+    await asyncio.sleep(seconds)
+    for task in tasks:
+        task.cancel()
+    capture.stop()
+    elapsed = time.ticks_diff(time.ticks_ms(), start) / 1000
+
+    stats = capture.get_stats()
+    return {
+        'mode': mode,
+        'fps': stats['captured'] / elapsed,
+        'dropped': stats['dropped'],
+        'overflows': stats['overflows'],
+        'max_latency_ms': stats['max_latency_ms']
+    }
+
+
+def run(seconds=DURATION_S):
+    can = MCP2515()
+    results = [asyncio.run(measure(can, mode, seconds)) for mode in MODES]
+
+    print("\nModo    | Quadros/s | Descartes | Overflows | Latência máx (ms)")
+    for r in results:
+        print(f"{r['mode']:<7} | {r['fps']:>9.0f} | {r['dropped']:>9} | "
+              f"{r['overflows']:>9} | {r['max_latency_ms']:>17}")
+    return results
+
+
+if __name__ == "__main__":
+    run()
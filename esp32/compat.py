@@ -0,0 +1,44 @@
+# Recursos do MicroPython usados pelos módulos, com equivalentes no CPython
+# para rodá-los fora do ESP32 (testes com machine simulado)
+import time
+
+try:
+    import micropython
+    MICROPYTHON = True
+except ImportError:
+    MICROPYTHON = False
+
+    class micropython:
+        """@micropython.native sem efeito no CPython
+
+        O MicroPython só compila um método como nativo com o decorador
+        escrito literalmente como @micropython.native (não por um alias).
+        """
+
+        @staticmethod
+        def native(function):
+            return function
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff, ticks_add, sleep_ms, sleep_us
+except ImportError:
+    TICKS_MASK = 0x3FFFFFFF  # ticks_* do MicroPython têm 30 bits
+    TICKS_HALF = 0x20000000
+
+    def ticks_ms():
+        return int(time.monotonic() * 1000) & TICKS_MASK
+
+    def ticks_us():
+        return int(time.monotonic() * 1000000) & TICKS_MASK
+
+    def ticks_diff(a, b):
+        return ((a - b + TICKS_HALF) & TICKS_MASK) - TICKS_HALF
+
+    def ticks_add(a, b):
+        return (a + b) & TICKS_MASK
+
+    def sleep_ms(ms):
+        time.sleep(ms / 1000)
+
+    def sleep_us(us):
+        time.sleep(us / 1000000)
@@ -0,0 +1,115 @@
+# Caminho crítico por quadro (captura -> histórico -> serialização)
+#
+# Cada função tem uma versão em Python puro (py_*, usada no CPython e
+# como referência) e, no MicroPython, uma versão compilada com o emissor
+# viper (viper_*) que acessa os buffers pré-alocados por ptr8/ptr32, sem
+# fatias nem objetos temporários. Os nomes sem prefixo apontam para a
+# versão mais rápida disponível; fastpath_benchmark.py compara as duas.
+#
+# As funções recebem buffer + posição em vez de fatias (que alocam
+# memória) e no máximo 4 argumentos (limite das funções viper). Os
+# métodos do laço de captura (can_capture) usam @micropython.native.
+#
+# Layout do quadro do MCP2515: SIDH, SIDL, EID8, EID0, DLC, D0..D7
+import struct
+from compat import MICROPYTHON, micropython
+
+FRAME_SIZE = 13
+
+
+def py_frame_id(buf, offset):
+    """ID do quadro em buf[offset:] (29 bits, ou 11 bits se padrão)"""
+    sidl = buf[offset + 1]
+    sid = (buf[offset] << 3) | (sidl >> 5)
+    if not sidl & 0x08:
+        return sid
+    return (sid << 18) | ((sidl & 0x03) << 16) | (buf[offset + 2] << 8) | buf[offset + 3]
+
+
+def py_store_frame(dst, index, src):
+    """Copia os 13 bytes do quadro src para a posição index de dst"""
+    start = index * FRAME_SIZE
+    dst[start:start + FRAME_SIZE] = src
+
+
+def py_store_data(dst, slot, src, start):
+    """Copia D0..D7 do quadro em src[start:] para dst[slot * 8]; retorna o DLC"""
+    pos = slot * 8
+    dst[pos:pos + 8] = src[start + 5:start + 13]
+    return min(src[start + 4] & 0x0F, 8)
+
+
+def py_pack_record(buf, offset, fields, data):
+    """Escreve um registro '<IIIH' + dados em buf[offset:]
+
+    fields: array('I') com seq, timestamp, ID, tamanho e a posição dos
+    dados em data. Retorna o offset após o registro.
+    """
+    seq, stamp, can_id, size, start = fields
+    struct.pack_into('<IIIH', buf, offset, seq, stamp, can_id, size)
+    offset += 14
+    buf[offset:offset + size] = data[start:start + size]
+    return offset + size
+
+
+if MICROPYTHON:
+    @micropython.viper
+    def viper_frame_id(buf, offset: int) -> int:
+        b = ptr8(buf)
+        sidl = int(b[offset + 1])
+        sid = (int(b[offset]) << 3) | (sidl >> 5)
+        if (sidl & 0x08) == 0:
+            return sid
+        return (sid << 18) | ((sidl & 0x03) << 16) | (int(b[offset + 2]) << 8) | int(b[offset + 3])
+
+    @micropython.viper
+    def viper_store_frame(dst, index: int, src):
+        d = ptr8(dst)
+        s = ptr8(src)
+        start = index * 13
+        for i in range(13):
+            d[start + i] = s[i]
+
+    @micropython.viper
+    def viper_store_data(dst, slot: int, src, start: int) -> int:
+        d = ptr8(dst)
+        s = ptr8(src)
+        pos = slot * 8
+        start += 5
+        for i in range(8):
+            d[pos + i] = s[start + i]
+        dlc = int(s[start - 1]) & 0x0F
+        return dlc if dlc < 8 else 8
+
+    @micropython.viper
+    def viper_pack_record(buf, offset: int, fields, data) -> int:
+        b = ptr8(buf)
+        f = ptr32(fields)
+        d = ptr8(data)
+        for i in range(3):
+            value = f[i]
+            pos = offset + 4 * i
+            b[pos] = value
+            b[pos + 1] = value >> 8
+            b[pos + 2] = value >> 16
+            b[pos + 3] = value >> 24
+        size = int(f[3])
+        start = int(f[4])
+        b[offset + 12] = size
+        b[offset + 13] = size >> 8
+        offset += 14
+        for i in range(size):
+            b[offset + i] = d[start + i]
+        return offset + size
+
+    frame_id = viper_frame_id
+    store_frame = viper_store_frame
+    store_data = viper_store_data
+    pack_record = viper_pack_record
+    COMPILED = True
+else:
+    frame_id = py_frame_id
+    store_frame = py_store_frame
+    store_data = py_store_data
+    pack_record = py_pack_record
+    COMPILED = False
@@ -0,0 +1,191 @@
+# Mede o custo por quadro do caminho crítico em Python puro e em viper
+#
+# Uso (não precisa do barramento nem do MCP2515):
+#     mpremote run esp32/fastpath_benchmark.py
+#
+# Para cada variante informa µs por quadro de cada etapa (ID, cópia para o
+# buffer circular, cópia para o histórico, serialização do registro) e do
+# pipeline completo (_store -> transfer -> pack_into), e a folga em relação
+# à taxa máxima de quadros estendidos de 8 bytes a 250 e 500 kbps.
+# No pipeline em Python, transfer e _store são as cópias sem
+# @micropython.native de PyCapture. No CPython roda apenas essa variante.
+from array import array
+import gc
+import can_capture
+import fastpath
+import frame_history
+import pgn_table
+from can_capture import CANCapture, FrameRing
+from compat import ticks_ms, ticks_us, ticks_diff
+from frame_history import FrameHistory, RECORD_SIZE
+from j1939_tp import TP_CM, TP_DT
+from pgn_table import PGNTable
+
+ROUNDS = 2000
+BATCH = 16  # Quadros por rodada de transfer (como uma drenagem)
+FRAME_BITS = 67 + 8 * 8  # Quadro estendido com 8 bytes (sem bit stuffing)
+BITRATES = (250000, 500000)
+NAMES = ('frame_id', 'store_frame', 'store_data', 'pack_record')
+
+# EEC1 (PGN 0xF004) da origem 0x00, prioridade 3, DLC 8
+FRAME = bytearray(b'\x67\x88\x04\x00\x08\x11\x22\x33\x44\x55\x66\x77\x88')
+
+
+class PyCapture(CANCapture):
+    """CANCapture com transfer e _store em Python puro (referência)
+
+    Cópias dos métodos de can_capture sem @micropython.native; mantenha
+    iguais aos originais.
+    """
+
+    def transfer(self, history):
+        ring = self.ring
+        lock = self.lock
+        count = 0
+        if lock:
+            lock.acquire()
+        try:
+            index = ring.peek()
+            if index >= 0:
+                latency = ticks_diff(ticks_ms(), ring.stamps[index])
+                if latency > self.max_latency_ms:
+                    self.max_latency_ms = latency
+            tp = self.tp
+            table = self.table
+            raw = ring.raw
+            stamps = ring.stamps
+            while index >= 0:
+                start = index * FrameRing.SLOT_SIZE
+                if raw[start + 1] & 0x08:
+                    can_id = fastpath.py_frame_id(raw, start)
+                    pf = (can_id >> 16) & 0xFF
+                    if tp and (pf == TP_CM or pf == TP_DT):
+                        tp.process(can_id, ring.view(index)[5:13], stamps[index])
+                    else:
+                        seq = history.append_raw(can_id, raw, stamps[index], start)
+                        if table is not None:
+                            table.update_raw(can_id, raw, stamps[index], seq, start)
+                        count += 1
+                ring.release()
+                index = ring.peek()
+        finally:
+            if lock:
+                lock.release()
+        if tp and tp.active:
+            tp.expire(ticks_ms())
+        return count
+
+    def _store(self, buffer):
+        self.bus_bits += 67 + 8 * min(buffer[4] & 0x0F, 8)
+        software_filter = self.software_filter
+        if software_filter and not (buffer[1] & 0x08 and
+                                    software_filter.match(fastpath.py_frame_id(buffer, 0))):
+            self.filtered += 1
+            return
+        stamp = ticks_ms()
+        if self.ring.push(buffer, stamp):
+            self.captured += 1
+            if self.first_frame_ms is None:
+                self.first_frame_ms = stamp
+
+
+def use(prefix):
+    """Aponta os módulos da captura para as funções py_ ou viper_"""
+    for module in (can_capture, frame_history, pgn_table):
+        for name in NAMES:
+            if hasattr(module, name):
+                setattr(module, name, getattr(fastpath, prefix + name))
+
+
+def per_frame(elapsed, baseline, count):
+    return max(0, elapsed - baseline) / count
+
+
+def bench_steps(prefix):
+    frame_id = getattr(fastpath, prefix + 'frame_id')
+    store_frame = getattr(fastpath, prefix + 'store_frame')
+    store_data = getattr(fastpath, prefix + 'store_data')
+    pack_record = getattr(fastpath, prefix + 'pack_record')
+    ring = bytearray(BATCH * fastpath.FRAME_SIZE)
+    data = bytearray(8 * BATCH)
+    out = bytearray(BATCH * (RECORD_SIZE + 8))
+    fields = array('I', [1, 2, 0x0CF00400, 8, 0])
+
+    start = ticks_us()
+    for i in range(ROUNDS):
+        pass
+    baseline = ticks_diff(ticks_us(), start)
+
+    results = {}
+    start = ticks_us()
+    for i in range(ROUNDS):
+        frame_id(FRAME, 0)
+    results['frame_id'] = per_frame(ticks_diff(ticks_us(), start), baseline, ROUNDS)
+
+    start = ticks_us()
+    for i in range(ROUNDS):
+        store_frame(ring, i % BATCH, FRAME)
+    results['store_frame'] = per_frame(ticks_diff(ticks_us(), start), baseline, ROUNDS)
+
+    start = ticks_us()
+    for i in range(ROUNDS):
+        store_data(data, i % BATCH, FRAME, 0)
+    results['store_data'] = per_frame(ticks_diff(ticks_us(), start), baseline, ROUNDS)
+
+    start = ticks_us()
+    for i in range(ROUNDS):
+        pack_record(out, (i % BATCH) * (RECORD_SIZE + 8), fields, FRAME)
+    results['pack_record'] = per_frame(ticks_diff(ticks_us(), start), baseline, ROUNDS)
+    return results
+
+
+def bench_pipeline(prefix):
+    """_store (IRQ) -> transfer (histórico e tabela) -> pack_into (streaming)"""
+    use(prefix)
+    capture = (PyCapture if prefix == 'py_' else CANCapture)(None, capacity=BATCH + 1)
+    capture.table = PGNTable(16)
+    history = FrameHistory(256)
+    out = bytearray(BATCH * (RECORD_SIZE + 8))
+    rounds = ROUNDS // BATCH
+    gc.collect()
+    start = ticks_us()
+    for _ in range(rounds):
+        for i in range(BATCH):
+            capture._store(FRAME)
+        capture.transfer(history)
+        offset = 0
+        for seq in range(history.next_seq - BATCH, history.next_seq):
+            offset = history.pack_into(out, offset, seq)
+    return ticks_diff(ticks_us(), start) / (rounds * BATCH)
+
+
+def run():
+    variants = ['py_']
+    if fastpath.COMPILED:
+        variants.append('viper_')
+
+    results = []
+    for prefix in variants:
+        steps = bench_steps(prefix)
+        steps['pipeline'] = bench_pipeline(prefix)
+        results.append((prefix[:-1], steps))
+    use('viper_' if fastpath.COMPILED else 'py_')
+
+    print("\nµs por quadro")
+    print(f"{'Variante':<8} | {'ID':>6} | {'Buffer':>6} | {'Histórico':>9} | {'Registro':>8} | {'Pipeline':>8}")
+    for name, r in results:
+        print(f"{name:<8} | {r['frame_id']:>6.1f} | {r['store_frame']:>6.1f} | {r['store_data']:>9.1f} | "
+              f"{r['pack_record']:>8.1f} | {r['pipeline']:>8.1f}")
+
+    print("\nFolga do pipeline na taxa máxima do barramento")
+    for bitrate in BITRATES:
+        budget = 1000000 * FRAME_BITS / bitrate  # µs entre quadros consecutivos
+        line = f"{bitrate // 1000} kbps ({1000000 / budget:.0f} quadros/s, {budget:.0f} µs/quadro):"
+        for name, r in results:
+            line += f"  {name} {100 * r['pipeline'] / budget:.0f}% da CPU"
+        print(line)
+    return results
+
+
+if __name__ == "__main__":
+    run()
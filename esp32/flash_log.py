@@ -0,0 +1,199 @@
+import json
+import os
+import struct
+import time
+
+# Segmento: cabeçalho SEGMENT_FORMAT seguido de registros RECORD_FORMAT
+# (frame_history), os mesmos do streaming binário
+SEGMENT_MAGIC = b'JL'
+SEGMENT_FORMAT = '<2sBBI'  # magic, versão, reservado, boot
+SEGMENT_HEADER_SIZE = 8
+SEGMENT_VERSION = 1
+INDEX_FILE = 'index.json'
+
+
+class FlashLog:
+    """Grava o histórico CAN em segmentos binários rotativos no littlefs
+
+    Os registros são acumulados em um buffer de block_size bytes e
+    gravados de uma vez quando o próximo registro não cabe ou após
+    flush_ms; assim cada escrita ocupa blocos inteiros da flash. Um
+    segmento é fechado ao atingir segment_bytes e os mais antigos são
+    apagados além de max_segments ou com pouco espaço livre. O índice
+    (index.json) é regravado apenas ao abrir um novo segmento.
+
+    A escrita roda no laço do asyncio e bloqueia o interpretador enquanto
+    a flash grava (e apaga) o bloco, por dezenas de ms: nesse intervalo
+    nenhuma drenagem agendada roda, e com o barramento carregado os dois
+    buffers de recepção do MCP2515 podem transbordar (overflows em
+    /metrics). Por isso o log fica desligado por padrão e, com
+    log_offline_only, só grava quando ninguém está recebendo os quadros.
+    """
+
+    def __init__(self, history, directory='log', segment_bytes=65536,
+                 max_segments=16, block_size=4096, flush_ms=10000):
+        self.history = history
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.flush_ms = flush_ms
+        self.buffer = bytearray(block_size)
+        self.used = 0  # Bytes ocupados no buffer
+        self.cursor = history.next_seq  # Próxima sequência a gravar
+        self.recording = False  # False enquanto em pausa (pause)
+        self.first_buffered = time.ticks_ms()
+
+        self.segments = []  # Índice: um dict por segmento, do mais antigo ao atual
+        self.file = None
+        self.boot = 0
+
+        # Contadores
+        self.records = 0
+        self.lost = 0  # Quadros sobrescritos no histórico antes da gravação
+        self.writes = 0
+        self.bytes_written = 0
+        self.errors = 0
+
+        self._load_index()
+
+    def _path(self, name):
+        return f"{self.directory}/{name}"
+
+    def _load_index(self):
+        """Carrega o índice e descarta entradas sem arquivo"""
+        try:
+            os.mkdir(self.directory)
+        except OSError:
+            pass
+        try:
+            with open(self._path(INDEX_FILE), 'r') as f:
+                index = json.load(f)
+            self.boot = index.get('boot', 0) + 1
+            files = os.listdir(self.directory)
+            self.segments = [s for s in index.get('segments', []) if s['name'] in files]
+            for segment in self.segments:
+                segment['bytes'] = os.stat(self._path(segment['name']))[6]
+        except:
+            print("Iniciando novo índice de log")
+        self._open_segment()
+
+    def _save_index(self):
+        try:
+            with open(self._path(INDEX_FILE), 'w') as f:
+                json.dump({'boot': self.boot, 'segments': self.segments}, f)
+        except:
+            self.errors += 1
+
+    def _free_space(self):
+        stat = os.statvfs(self.directory)
+        return stat[0] * stat[3]
+
+    def _open_segment(self):
+        """Fecha o segmento atual e abre o próximo"""
+        if self.file:
+            self.file.close()
+            self.file = None
+        number = self.segments[-1]['number'] + 1 if self.segments else 0
+
+        # Apaga os segmentos mais antigos para respeitar limite e espaço livre
+        while self.segments and (len(self.segments) >= self.max_segments or
+                                 self._free_space() < 2 * self.segment_bytes):
+            oldest = self.segments.pop(0)
+            try:
+                os.remove(self._path(oldest['name']))
+            except OSError:
+                pass
+
+        segment = {
+            'name': f"{number:08d}.bin",
+            'number': number,
+            'boot': self.boot,
+            'first_seq': self.cursor,
+            'last_seq': self.cursor - 1,
+            'bytes': SEGMENT_HEADER_SIZE
+        }
+        self.segments.append(segment)
+        self._save_index()
+        try:
+            self.file = open(self._path(segment['name']), 'wb')
+            self.file.write(struct.pack(SEGMENT_FORMAT, SEGMENT_MAGIC, SEGMENT_VERSION, 0, self.boot))
+        except OSError as e:
+            print(f"Erro ao abrir segmento de log: {e}")
+            self.errors += 1
+            self.file = None
+
+    def collect(self):
+        """Copia os quadros novos do histórico para o buffer
+
+        Grava o buffer na flash quando enche ou após flush_ms.
+        """
+        history = self.history
+        self.recording = True
+        if self.cursor < history.first_seq:
+            self.lost += history.first_seq - self.cursor
+            self.cursor = history.first_seq
+        buf = self.buffer
+        while self.cursor < history.next_seq:
+            size = history.record_size(self.cursor)
+            if self.used + size > len(buf):
+                self.flush()
+            if not self.used:
+                self.first_buffered = time.ticks_ms()
+            self.used = history.pack_into(buf, self.used, self.cursor)
+            self.cursor += 1
+            self.records += 1
+
+        if self.used and time.ticks_diff(time.ticks_ms(), self.first_buffered) >= self.flush_ms:
+            self.flush()
+
+    def pause(self):
+        """Grava o que está no buffer e pula os quadros até o próximo collect"""
+        self.flush()
+        self.cursor = self.history.next_seq
+        self.recording = False
+
+    def flush(self):
+        """Grava o buffer no segmento atual em uma única escrita"""
+        if not self.used:
+            return
+        segment = self.segments[-1]
+        if self.file:
+            try:
+                self.file.write(memoryview(self.buffer)[:self.used])
+                self.file.flush()
+                self.writes += 1
+                self.bytes_written += self.used
+                segment['bytes'] += self.used
+                segment['last_seq'] = self.cursor - 1
+            except OSError as e:
+                print(f"Erro ao gravar log: {e}")
+                self.errors += 1
+        self.used = 0
+        if segment['bytes'] >= self.segment_bytes:
+            self._open_segment()
+
+    def get_segments(self):
+        """Índice dos segmentos (o último ainda em gravação)"""
+        return self.segments
+
+    def find(self, name):
+        """Caminho de um segmento do índice ou None"""
+        for segment in self.segments:
+            if segment['name'] == name:
+                if segment is self.segments[-1]:
+                    self.flush()  # Inclui os quadros ainda no buffer
+                return self._path(name)
+        return None
+
+    def get_stats(self):
+        return {
+            'recording': self.recording,
+            'segments': len(self.segments),
+            'records': self.records,
+            'lost': self.lost,
+            'writes': self.writes,
+            'bytes_written': self.bytes_written,
+            'buffered': self.used,
+            'errors': self.errors,
+            'boot': self.boot
+        }
@@ -0,0 +1,167 @@
+from array import array
+from can_handler import J1939Frame
+from fastpath import store_data, pack_record
+import struct
+
+# Registro binário: seq, timestamp, ID, tamanho + dados (tamanho bytes)
+RECORD_FORMAT = '<IIIH'
+RECORD_SIZE = 14
+
+# DLC que marca mensagem longa (TP): os 8 bytes da posição guardam
+# posição e tamanho do payload na área de payloads
+LONG_DLC = 0xFF
+LONG_REF = '<IH'
+
+
+class FrameHistory:
+    """Histórico circular pré-alocado de quadros CAN
+
+    Cada posição guarda ID, DLC, 8 bytes de dados e timestamp em arrays de
+    tamanho fixo. Os quadros recebem números de sequência crescentes; a
+    posição de um quadro é seq % capacity. Mensagens remontadas do
+    transporte J1939 (até 1785 bytes) ocupam uma posição e têm o payload
+    em uma área circular separada de payload_capacity bytes.
+    """
+
+    def __init__(self, capacity=2000, payload_capacity=8192):
+        self.capacity = capacity
+        self.ids = array('I', bytearray(4 * capacity))
+        self.stamps = array('I', bytearray(4 * capacity))
+        self.dlcs = bytearray(capacity)
+        self.data = bytearray(8 * capacity)
+        self.next_seq = 0  # Sequência do próximo quadro
+
+        self.payload_capacity = payload_capacity
+        self.payloads = bytearray(payload_capacity)
+        self.payload_pos = 0  # Posição absoluta (crescente) do próximo payload
+        
+        # seq, timestamp, ID, tamanho, posição dos dados (pack_record)
+        self._fields = array('I', bytearray(4 * 5))
+
+    def __len__(self):
+        return min(self.next_seq, self.capacity)
+
+    @property
+    def first_seq(self):
+        """Sequência do quadro mais antigo ainda disponível"""
+        return max(0, self.next_seq - self.capacity)
+
+    @property
+    def last_seq(self):
+        """Sequência do quadro mais recente (-1 se vazio)"""
+        return self.next_seq - 1
+
+    def append_raw(self, can_id, buffer, timestamp, start=0):
+        """Adiciona o quadro de buffer[start:] no formato do MCP2515 (SIDH..D7)"""
+        seq = self.next_seq
+        slot = seq % self.capacity
+        self.ids[slot] = can_id
+        self.stamps[slot] = timestamp
+        self.dlcs[slot] = store_data(self.data, slot, buffer, start)
+        self.next_seq = seq + 1
+        return seq
+
+    def append_long(self, can_id, payload, timestamp):
+        """Adiciona uma mensagem remontada de mais de 8 bytes"""
+        size = len(payload)
+        if size > self.payload_capacity:
+            return -1
+        pos = self.payload_pos
+        offset = pos % self.payload_capacity
+        first = min(size, self.payload_capacity - offset)
+        self.payloads[offset:offset + first] = payload[:first]
+        if first < size:  # Continua no início da área circular
+            self.payloads[0:size - first] = payload[first:]
+        self.payload_pos = pos + size
+
+        seq = self.next_seq
+        slot = seq % self.capacity
+        self.ids[slot] = can_id
+        self.stamps[slot] = timestamp
+        self.dlcs[slot] = LONG_DLC
+        struct.pack_into(LONG_REF, self.data, slot * 8, pos, size)
+        self.next_seq = seq + 1
+        return seq
+
+    def _payload(self, slot):
+        """Payload de uma mensagem longa ou None se já sobrescrito"""
+        pos, size = struct.unpack_from(LONG_REF, self.data, slot * 8)
+        if self.payload_pos - pos > self.payload_capacity:
+            return None
+        offset = pos % self.payload_capacity
+        first = min(size, self.payload_capacity - offset)
+        payload = bytes(self.payloads[offset:offset + first])
+        if first < size:
+            payload += bytes(self.payloads[0:size - first])
+        return payload
+
+    def get(self, seq):
+        """Retorna o quadro da sequência ou None se já sobrescrito"""
+        if seq < self.first_seq or seq >= self.next_seq:
+            return None
+        slot = seq % self.capacity
+        dlc = self.dlcs[slot]
+        if dlc == LONG_DLC:
+            data = self._payload(slot)
+            if data is None:
+                return None
+        else:
+            start = slot * 8
+            data = bytes(self.data[start:start + dlc])
+        return J1939Frame(self.ids[slot], data, self.stamps[slot])
+
+    def window(self, since=None, limit=100):
+        """(início, fim) das sequências lidas por frames(since, limit)"""
+        start = self.first_seq if since is None else max(since, self.first_seq)
+        if since is None:
+            start = max(start, self.next_seq - limit)
+        return start, min(self.next_seq, start + limit)
+    
+    def frames(self, since=None, limit=100):
+        """Itera (seq, quadro) a partir de since, no máximo limit quadros"""
+        start, end = self.window(since, limit)
+        for seq in range(start, end):
+            frame = self.get(seq)
+            if frame:
+                yield seq, frame
+
+    def record_size(self, seq):
+        """Tamanho do registro binário do quadro seq"""
+        slot = seq % self.capacity
+        dlc = self.dlcs[slot]
+        if dlc == LONG_DLC:
+            dlc = struct.unpack_from(LONG_REF, self.data, slot * 8)[1]
+        return RECORD_SIZE + dlc
+
+    def pack_into(self, buf, offset, seq):
+        """Escreve o quadro seq em buf no formato RECORD_FORMAT
+
+        Retorna o offset após o registro.
+        """
+        slot = seq % self.capacity
+        dlc = self.dlcs[slot]
+        if dlc == LONG_DLC:
+            # Payload sobrescrito é enviado vazio para manter a sequência
+            payload = self._payload(slot) or b''
+            size = len(payload)
+            struct.pack_into(RECORD_FORMAT, buf, offset, seq, self.stamps[slot], self.ids[slot], size)
+            offset += RECORD_SIZE
+            buf[offset:offset + size] = payload
+            return offset + size
+        fields = self._fields
+        fields[0] = seq
+        fields[1] = self.stamps[slot]
+        fields[2] = self.ids[slot]
+        fields[3] = dlc
+        fields[4] = slot * 8
+        return pack_record(buf, offset, fields, self.data)
+
+    def get_stats(self):
+        """Retorna ocupação do histórico"""
+        return {
+            'capacity': self.capacity,
+            'count': len(self),
+            'first_seq': self.first_seq,
+            'last_seq': self.last_seq,
+            'payload_capacity': self.payload_capacity
+        }
@@ -0,0 +1,118 @@
+import asyncio
+import struct
+from frame_history import RECORD_SIZE
+
+# Lote: magic, tamanho do payload, quadros perdidos + registros do histórico
+MAGIC = b'JD'
+HEADER_FORMAT = '<2sHI'
+HEADER_SIZE = 8
+
+
+class StreamClient:
+    """Conexão de streaming com cursor e buffer de lote próprios"""
+
+    def __init__(self, writer, addr, cursor, buffer_size):
+        self.writer = writer
+        self.addr = addr
+        self.cursor = cursor  # Próxima sequência a enviar
+        self.buffer = bytearray(buffer_size)
+        self.closed = False
+
+    async def listen(self, reader):
+        """Descarta o que o cliente enviar e marca a conexão fechada no EOF
+
+        Sem esta leitura, um cliente que desconecta com o barramento
+        parado nunca seria notado e ocuparia a vaga para sempre.
+        """
+        try:
+            while await reader.read(64):
+                pass
+        except OSError:
+            pass
+        self.closed = True
+
+
+class FrameStreamServer:
+    """Envia quadros CAN em lotes binários por conexões TCP persistentes
+
+    Cada lote é um cabeçalho HEADER_FORMAT seguido de registros
+    RECORD_FORMAT (frame_history) com os dados de cada quadro.
+    """
+
+    def __init__(self, history, port=8081, max_clients=3, max_batch=128):
+        self.history = history
+        self.port = port
+        self.max_clients = max_clients
+        self.max_batch = max_batch
+        # Sempre cabe ao menos uma mensagem TP completa (1785 bytes)
+        self.buffer_size = HEADER_SIZE + max(max_batch * (RECORD_SIZE + 8), RECORD_SIZE + 1785)
+        self.server = None
+        self.clients = []
+        self.frames_sent = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, '0.0.0.0', self.port, backlog=1)
+        print(f'Streaming binário na porta {self.port}')
+
+    async def _serve(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        if len(self.clients) >= self.max_clients:
+            writer.close()
+            await writer.wait_closed()
+            return
+
+        # Começa pelos quadros que chegarem a partir de agora
+        client = StreamClient(writer, addr, self.history.next_seq, self.buffer_size)
+        self.clients.append(client)
+        print(f'Cliente de streaming conectado de {addr}')
+        asyncio.create_task(client.listen(reader))
+        try:
+            while not client.closed:
+                size = self._fill(client)
+                if size:
+                    # drain() aplica contrapressão: cliente lento fica para trás no cursor
+                    writer.write(memoryview(client.buffer)[:size])
+                    await writer.drain()
+                else:
+                    await asyncio.sleep_ms(20)
+        except OSError:
+            pass
+        finally:
+            print(f'Cliente de streaming desconectado: {addr}')
+            self.clients.remove(client)
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    def _fill(self, client):
+        """Monta o próximo lote no buffer do cliente; retorna o tamanho"""
+        history = self.history
+        seq = client.cursor
+        lost = 0
+        if seq < history.first_seq:
+            lost = history.first_seq - seq
+            seq = history.first_seq
+        end = min(history.next_seq, seq + self.max_batch)
+        if seq == end and not lost:
+            return 0
+
+        buf = client.buffer
+        offset = HEADER_SIZE
+        first = seq
+        # Mensagens TP longas podem encerrar o lote antes de max_batch
+        while seq < end and offset + history.record_size(seq) <= len(buf):
+            offset = history.pack_into(buf, offset, seq)
+            seq += 1
+        struct.pack_into(HEADER_FORMAT, buf, 0, MAGIC, offset - HEADER_SIZE, lost)
+        self.frames_sent += seq - first
+        client.cursor = seq
+        return offset
+
+    def get_stats(self):
+        return {
+            'port': self.port,
+            'clients': len(self.clients),
+            'frames_sent': self.frames_sent
+        }
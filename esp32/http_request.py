@@ -0,0 +1,189 @@
+import asyncio
+import json
+
+MAX_LINE = 1024  # Linha de requisição ou cabeçalho
+MAX_HEADERS = 24
+MAX_BODY = 4096
+
+STATUS_TEXT = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable'
+}
+
+
+class BadRequest(Exception):
+    """Requisição rejeitada; status é o código da resposta"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class RequestReader:
+    """Leitura de uma conexão HTTP com linhas de tamanho limitado
+
+    O socket é lido em blocos de no máximo limit bytes; uma linha sem
+    '\n' dentro desse limite gera BadRequest antes de crescer mais. Os
+    bytes lidos além da linha ficam em pending para a próxima leitura
+    (cabeçalhos, corpo, próxima requisição ou quadros WebSocket).
+    """
+
+    def __init__(self, reader, limit=MAX_LINE):
+        self.reader = reader
+        self.limit = limit
+        self.pending = b''
+
+    async def readline(self):
+        """Próxima linha com o '\n' (b'' se o cliente fechou a conexão)"""
+        line = self.pending
+        while True:
+            end = line.find(b'\n')
+            if end >= 0:
+                self.pending = line[end + 1:]
+                return line[:end + 1]
+            if len(line) >= self.limit:
+                raise BadRequest('linha muito longa')
+            data = await self.reader.read(self.limit - len(line))
+            if not data:
+                self.pending = b''
+                return line
+            line += data
+
+    async def read(self, n):
+        if self.pending:
+            data = self.pending[:n]
+            self.pending = self.pending[n:]
+            return data
+        return await self.reader.read(n)
+
+    async def readexactly(self, n):
+        data = self.pending[:n]
+        self.pending = self.pending[n:]
+        if len(data) < n:
+            data += await self.reader.readexactly(n - len(data))
+        return data
+
+
+class HTTPRequest:
+    """Requisição HTTP/1.x já lida do socket"""
+
+    __slots__ = ('method', 'target', 'path', 'version', 'headers', 'body', '_query')
+
+    def __init__(self, method, target, version, headers, body):
+        self.method = method
+        self.target = target
+        self.path = target.split('?', 1)[0]
+        self.version = version
+        self.headers = headers  # Nomes em minúsculas
+        self.body = body
+        self._query = None
+
+    @property
+    def query(self):
+        """Parâmetros da query string (calculados no primeiro uso)"""
+        if self._query is None:
+            self._query = parse_query(self.target)
+        return self._query
+
+    @property
+    def keep_alive(self):
+        """HTTP/1.1 mantém a conexão, salvo 'Connection: close'"""
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.1':
+            return connection != 'close'
+        return connection == 'keep-alive'
+
+    def header(self, name):
+        return self.headers.get(name.lower())
+
+    def json(self):
+        """Corpo como objeto JSON; BadRequest se inválido"""
+        try:
+            value = json.loads(self.body)
+        except ValueError:
+            raise BadRequest('JSON inválido')
+        if not isinstance(value, dict):
+            raise BadRequest('JSON deve ser um objeto')
+        return value
+
+
+def parse_query(target):
+    """Extrai os parâmetros da query string do alvo da requisição"""
+    params = {}
+    if '?' not in target:
+        return params
+    for pair in target.split('?', 1)[1].split('&'):
+        if '=' in pair:
+            key, value = pair.split('=', 1)
+            params[key] = value
+    return params
+
+
+async def read_request(reader, timeout=None):
+    """Lê uma requisição completa (com corpo pelo Content-Length)
+
+    reader é um RequestReader. Retorna None se o cliente fechou a conexão
+    (mesmo no meio do corpo) ou não enviou a requisição inteira em
+    timeout segundos; BadRequest para requisições malformadas (413 para
+    corpo grande demais).
+    """
+    try:
+        if timeout:
+            return await asyncio.wait_for(_read_request(reader), timeout)
+        return await _read_request(reader)
+    except asyncio.TimeoutError:
+        return None
+
+
+async def _read_request(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+
+    parts = line.decode().split()
+    if len(parts) != 3:
+        raise BadRequest('linha de requisição inválida')
+    method, target, version = parts
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line or line == b'\r\n' or line == b'\n':
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise BadRequest('cabeçalhos demais')
+        name, sep, value = line.decode().partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+
+    body = b''
+    length = headers.get('content-length')
+    if length:
+        length = int(length)
+        if length > MAX_BODY:
+            raise BadRequest('corpo muito grande', 413)
+        try:
+            body = await reader.readexactly(length)
+        except EOFError:
+            # Cliente desconectou no meio do corpo (IncompleteReadError
+            # no CPython é subclasse de EOFError)
+            return None
+
+    return HTTPRequest(method, target, version, headers, body)
+
+
+def response_head(status, content_type=None, length=0, keep_alive=False, extra=None):
+    """Linha de status e cabeçalhos de uma resposta, em bytes"""
+    head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+    if content_type:
+        head += f"Content-Type: {content_type}\r\n"
+    head += f"Content-Length: {length}\r\n"
+    if extra:
+        head += extra
+    head += "Connection: keep-alive\r\n\r\n" if keep_alive else "Connection: close\r\n\r\n"
+    return head.encode()
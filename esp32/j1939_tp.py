@@ -0,0 +1,166 @@
+from compat import ticks_diff, ticks_add
+
+# Transporte J1939-21
+TP_CM = 0xEC  # PF do TP.CM (gerenciamento de conexão)
+TP_DT = 0xEB  # PF do TP.DT (transferência de dados)
+CM_RTS = 16
+CM_CTS = 17
+CM_EOM_ACK = 19
+CM_BAM = 32
+CM_ABORT = 255
+MAX_PAYLOAD = 1785  # 255 pacotes x 7 bytes
+
+# Timeouts (ms)
+T1 = 750   # Entre pacotes TP.DT
+T2 = 1250  # Após CTS, até o próximo TP.DT
+T3 = 1250  # Após RTS, até o CTS
+T4 = 1050  # CTS de espera (0 pacotes)
+
+
+class TPReassembler:
+    """Remonta mensagens J1939 multi-pacote (BAM e RTS/CTS)
+
+    Observa passivamente TP.CM/TP.DT e entrega o payload completo ao
+    histórico como uma única mensagem, com o ID do PGN transportado.
+    As sessões usam um conjunto fixo de buffers; cada sessão é
+    identificada por (origem, destino) e guarda o PGN anunciado.
+    """
+
+    def __init__(self, history, sessions=4):
+        self.history = history
+        self.table = None  # PGNTable atualizada com as mensagens completas
+        self.buffers = [bytearray(MAX_PAYLOAD) for _ in range(sessions)]
+        self.keys = [-1] * sessions  # (origem << 8) | destino; -1 = livre
+        self.pgns = [0] * sessions
+        self.priorities = [0] * sessions
+        self.sizes = [0] * sessions
+        self.packets = [0] * sessions
+        self.expected = [0] * sessions  # Próximo número de pacote esperado
+        self.broadcast = [False] * sessions
+        self.deadlines = [0] * sessions
+        self.active = 0
+
+        # Contadores
+        self.completed = 0
+        self.timeouts = 0
+        self.aborted = 0
+        self.no_session = 0  # Sessões ignoradas por falta de buffer
+        self.sequence_errors = 0
+
+    def process(self, can_id, data, timestamp):
+        """Trata um quadro TP.CM ou TP.DT"""
+        pf = (can_id >> 16) & 0xFF
+        source = can_id & 0xFF
+        destination = (can_id >> 8) & 0xFF
+        if pf == TP_DT:
+            self._data(source, destination, data, timestamp)
+        elif pf == TP_CM:
+            self._control(can_id, source, destination, data, timestamp)
+
+    def _find(self, key):
+        keys = self.keys
+        for i in range(len(keys)):
+            if keys[i] == key:
+                return i
+        return -1
+
+    def _free(self, index):
+        self.keys[index] = -1
+        self.active -= 1
+
+    def _control(self, can_id, source, destination, data, now):
+        control = data[0]
+        if control == CM_BAM or control == CM_RTS:
+            size = data[1] | (data[2] << 8)
+            packets = data[3]
+            if size < 9 or size > MAX_PAYLOAD or packets != (size + 6) // 7:
+                return
+            key = (source << 8) | destination
+            index = self._find(key)  # Nova sessão substitui a anterior
+            if index < 0:
+                index = self._find(-1)
+                if index < 0:
+                    self.no_session += 1
+                    return
+                self.active += 1
+            self.keys[index] = key
+            self.pgns[index] = data[5] | (data[6] << 8) | (data[7] << 16)
+            self.priorities[index] = (can_id >> 26) & 0x07
+            self.sizes[index] = size
+            self.packets[index] = packets
+            self.expected[index] = 1
+            self.broadcast[index] = control == CM_BAM
+            self.deadlines[index] = ticks_add(now, T1 if control == CM_BAM else T3)
+
+        elif control == CM_CTS:
+            # CTS vai do receptor para o transmissor da sessão
+            index = self._find((destination << 8) | source)
+            if index >= 0:
+                if data[1]:
+                    self.expected[index] = data[2]  # Pode pedir retransmissão
+                    self.deadlines[index] = ticks_add(now, T2)
+                else:
+                    self.deadlines[index] = ticks_add(now, T4)
+
+        elif control == CM_EOM_ACK or control == CM_ABORT:
+            # EOM_ACK encerra a sessão normalmente: libera sem contar como abortada
+            for key in ((source << 8) | destination, (destination << 8) | source):
+                index = self._find(key)
+                if index >= 0:
+                    self._free(index)
+                    if control == CM_ABORT:
+                        self.aborted += 1
+
+    def _data(self, source, destination, data, now):
+        index = self._find((source << 8) | destination)
+        if index < 0:
+            return
+        number = data[0]
+        if number != self.expected[index]:
+            self.sequence_errors += 1
+            if self.broadcast[index]:
+                self._free(index)  # BAM não tem retransmissão
+            return
+
+        size = self.sizes[index]
+        offset = (number - 1) * 7
+        count = min(7, size - offset)
+        self.buffers[index][offset:offset + count] = data[1:1 + count]
+
+        if number == self.packets[index]:
+            self._deliver(index, destination, now)
+        else:
+            self.expected[index] = number + 1
+            self.deadlines[index] = ticks_add(now, T1)
+
+    def _deliver(self, index, destination, timestamp):
+        pgn = self.pgns[index]
+        if (pgn >> 8) & 0xFF < 240:  # PDU1: destino no campo PS
+            pgn = (pgn & 0x3FF00) | destination
+        can_id = (self.priorities[index] << 26) | (pgn << 8) | (self.keys[index] >> 8)
+        payload = memoryview(self.buffers[index])[:self.sizes[index]]
+        seq = self.history.append_long(can_id, payload, timestamp)
+        if self.table is not None:
+            self.table.update(can_id, payload, timestamp, seq)
+        self.completed += 1
+        self._free(index)
+
+    def expire(self, now):
+        """Descarta sessões que excederam o timeout"""
+        if not self.active:
+            return
+        keys = self.keys
+        for i in range(len(keys)):
+            if keys[i] >= 0 and ticks_diff(now, self.deadlines[i]) > 0:
+                self._free(i)
+                self.timeouts += 1
+
+    def get_stats(self):
+        return {
+            'active': self.active,
+            'completed': self.completed,
+            'timeouts': self.timeouts,
+            'aborted': self.aborted,
+            'no_session': self.no_session,
+            'sequence_errors': self.sequence_errors
+        }
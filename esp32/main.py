@@ -1,45 +1,123 @@
-from wifi_manager import WiFiManager
+from wifi_manager import WiFiManager, CONNECTED
 from can_handler import MCP2515
+from can_capture import CANCapture
+from frame_history import FrameHistory
+from frame_stream import FrameStreamServer
+from j1939_tp import TPReassembler
+from pgn_table import PGNTable
+from flash_log import FlashLog
+from settings import load_settings
 from web_server import WebServer
+import asyncio
+import gc
 import time
 
-def main():
+async def can_task(server, capture):
+    """Move quadros capturados para o histórico a cada 10 ms"""
+    reported = False
+    while True:
+        try:
+            server.poll_can()
+            capture.poll()
+        except Exception as e:
+            print(f"Erro na captura CAN: {e}")
+        if not reported and capture.first_frame_ms is not None:
+            reported = True
+            print(f"Primeiro quadro CAN {capture.first_frame_ms} ms após o boot")
+        await asyncio.sleep_ms(10)
+
+async def wifi_task(wifi):
+    """Avança a conexão WiFi em segundo plano"""
+    while True:
+        try:
+            wifi.supervise()
+        except Exception as e:
+            print(f"Erro no WiFi: {e}")
+        await asyncio.sleep_ms(500)
+
+async def log_task(log, wifi, server, stream, offline_only):
+    """Grava os quadros do histórico na flash em blocos
+
+    Com offline_only, grava apenas sem conexão WiFi e sem clientes no
+    WebSocket ou no streaming; nos demais casos o log fica em pausa.
+    """
+    while True:
+        try:
+            if offline_only and (wifi.state == CONNECTED or server.ws_clients or stream.clients):
+                log.pause()
+            else:
+                log.collect()
+        except Exception as e:
+            print(f"Erro no log: {e}")
+        await asyncio.sleep_ms(250)
+
+async def housekeeping_task(server):
+    """Coleta de lixo periódica, fora do caminho das requisições"""
+    while True:
+        if server.profiler:
+            server.profiler.collect()
+        else:
+            gc.collect()
+        await asyncio.sleep(10)
+
+async def main():
     print("\nIniciando sistema...")
+    settings = load_settings()
+    
+    # Inicializa o controlador CAN antes do WiFi: captura desde o boot
+    can = MCP2515(bitrate=settings['can_bitrate'])
+    
+    # Histórico pré-alocado de quadros
+    history = FrameHistory(settings['history_capacity'], settings['history_payload_bytes'])
+    
+    # Captura CAN por interrupção, independente das requisições HTTP
+    capture = CANCapture(can, capacity=settings['capture_capacity'])
+    capture.start(settings['capture_mode'])
     
-    # Inicializa o gerenciador WiFi
-    wifi = WiFiManager()
+    # Inicializa o gerenciador WiFi (conecta em segundo plano, sem bloquear)
+    wifi = WiFiManager(settings['ap_ssid'], settings['ap_password'],
+                       static_ip=settings['wifi_static_ip'])
     
-    # Aguarda um pouco para garantir que o WiFi esteja estável
-    time.sleep(2)
+    # Remonta mensagens J1939 multi-pacote (BAM e RTS/CTS) antes do histórico
+    capture.tp = TPReassembler(history, settings['tp_sessions'])
     
-    # Inicializa o controlador CAN
-    can = MCP2515()
+    # Último valor de cada (PGN, origem), servido em /snapshot
+    table = PGNTable(settings['snapshot_entries'])
+    capture.table = table
+    capture.tp.table = table
+    
+    # Filtros de PGN gravados na configuração (vazio = todo o barramento)
+    if settings['filter_pgns']:
+        capture.set_filters(settings['filter_pgns'])
+    
+    # Log rotativo na flash para períodos fora do alcance do WiFi
+    log = None
+    if settings['log_enabled']:
+        log = FlashLog(history, segment_bytes=settings['log_segment_bytes'],
+                       max_segments=settings['log_max_segments'])
     
     # Inicializa o servidor web
-    server = WebServer(wifi, can)
-    server.start()
+    server = WebServer(wifi, can, capture, history, table, log)
+    server.enable_profiler(settings['profiler_enabled'], settings['profiler_size'])
+    await server.start()
+    
+    # Streaming binário de quadros (conexões persistentes)
+    stream = FrameStreamServer(history, port=settings['stream_port'])
+    await stream.start()
     
-    print("\nSistema iniciado!")
+    print(f"\nSistema iniciado em {time.ticks_ms()} ms após o boot!")
     status = wifi.get_status()
-    if status['sta_connected']:
-        print(f"Conectado à rede WiFi. IP: {status['sta_ip']}")
+    if status['state'] == 'connecting':
+        print(f"Conectando à rede WiFi {status['ssid']} em segundo plano...")
     else:
         print(f"Modo AP ativo. IP: {status['ap_ip']}")
     print("Aguardando conexões...")
     
-    while True:
-        try:
-            # Aceita conexões
-            client, addr = server.socket.accept()
-            print(f'Cliente conectado de {addr}')
-            
-            # Processa requisição
-            server.handle_request(client)
-            
-        except Exception as e:
-            print(f"Erro: {e}")
-        
-        time.sleep(0.1)
+    asyncio.create_task(wifi_task(wifi))
+    asyncio.create_task(housekeeping_task(server))
+    if log:
+        asyncio.create_task(log_task(log, wifi, server, stream, settings['log_offline_only']))
+    await can_task(server, capture)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main())
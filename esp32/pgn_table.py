@@ -0,0 +1,100 @@
+from array import array
+from can_handler import j1939_pgn
+from fastpath import store_data
+
+
+class PGNTable:
+    """Último valor de cada (PGN, origem) com contagem e período
+
+    Tabela pré-alocada de max_entries posições, atualizada pela captura
+    a cada quadro. Guarda os 8 primeiros bytes de dados; para mensagens
+    remontadas (TP) o payload completo fica no histórico, na sequência
+    indicada em 'seq'. O período é uma média móvel (1/8) do intervalo
+    entre recepções, em ms.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self.index = {}  # (PGN << 8) | origem -> posição
+        self.ids = array('I', bytearray(4 * max_entries))
+        self.counts = array('I', bytearray(4 * max_entries))
+        self.stamps = array('I', bytearray(4 * max_entries))
+        self.periods = array('I', bytearray(4 * max_entries))
+        self.seqs = array('i', bytearray(4 * max_entries))
+        self.lengths = array('H', bytearray(2 * max_entries))
+        self.data = bytearray(8 * max_entries)
+        self.full = 0  # Quadros de chaves novas recusados com a tabela cheia
+
+    def __len__(self):
+        return len(self.index)
+
+    def update(self, can_id, data, timestamp, seq=-1):
+        """Registra um quadro (data com 8 bytes ou payload remontado)"""
+        slot = self._slot(can_id, timestamp, seq)
+        if slot is None:
+            return
+        self.lengths[slot] = len(data)
+        start = slot * 8
+        size = min(len(data), 8)
+        self.data[start:start + size] = data[:size]
+
+    def update_raw(self, can_id, buffer, timestamp, seq=-1, start=0):
+        """Registra o quadro de buffer[start:] no formato do MCP2515 (SIDH..D7)"""
+        slot = self._slot(can_id, timestamp, seq)
+        if slot is not None:
+            self.lengths[slot] = store_data(self.data, slot, buffer, start)
+
+    def _slot(self, can_id, timestamp, seq):
+        """Posição do (PGN, origem) com contagem e período atualizados"""
+        key = (j1939_pgn(can_id) << 8) | (can_id & 0xFF)
+        slot = self.index.get(key)
+        if slot is None:
+            slot = len(self.index)
+            if slot >= self.max_entries:
+                self.full += 1
+                return None
+            self.index[key] = slot
+        else:
+            interval = (timestamp - self.stamps[slot]) & 0x3FFFFFFF
+            period = self.periods[slot]
+            self.periods[slot] = interval if not period else period + ((interval - period) >> 3)
+
+        self.ids[slot] = can_id
+        self.counts[slot] += 1
+        self.stamps[slot] = timestamp
+        self.seqs[slot] = seq
+        return slot
+
+    def snapshot(self):
+        """Lista com a entrada mais recente de cada (PGN, origem)"""
+        entries = []
+        for key, slot in self.index.items():
+            start = slot * 8
+            length = self.lengths[slot]
+            entries.append({
+                'id': hex(self.ids[slot]),
+                'pgn': hex(key >> 8),
+                'source': key & 0xFF,
+                'data': list(self.data[start:start + min(length, 8)]),
+                'length': length,
+                'seq': self.seqs[slot],
+                'count': self.counts[slot],
+                'timestamp': self.stamps[slot],
+                'period_ms': self.periods[slot]
+            })
+        return entries
+
+    def pgn_counts(self):
+        """Quadros recebidos por PGN (somando as origens)"""
+        counts = {}
+        for key, slot in self.index.items():
+            pgn = hex(key >> 8)
+            counts[pgn] = counts.get(pgn, 0) + self.counts[slot]
+        return counts
+
+    def get_stats(self):
+        return {
+            'entries': len(self.index),
+            'max_entries': self.max_entries,
+            'full': self.full
+        }
@@ -0,0 +1,141 @@
+from array import array
+import gc
+import time
+
+try:
+    import esp32
+except ImportError:  # Fora do ESP32: sem estatísticas do heap do IDF
+    esp32 = None
+
+try:
+    import machine
+except ImportError:
+    machine = None
+
+
+def route_of(path):
+    """Primeiro segmento do caminho ('/log/x.bin' -> '/log')"""
+    try:
+        return '/' + path.split('/', 2)[1]
+    except IndexError:
+        return '?'
+
+
+class Profiler:
+    """Tempo e memória por requisição em um buffer circular fixo
+
+    Desligado, o servidor guarda None em vez do Profiler e cada
+    requisição custa apenas um teste de None.
+    """
+
+    def __init__(self, size=32):
+        self.size = size
+        self.routes = [''] * size
+        self.durations = array('I', bytearray(4 * size))  # us
+        self.free_before = array('I', bytearray(4 * size))
+        self.free_after = array('I', bytearray(4 * size))
+        self.alloc_before = array('I', bytearray(4 * size))
+        self.alloc_after = array('I', bytearray(4 * size))
+        self.count = 0  # Requisições registradas (posição = count % size)
+
+        self.endpoints = {}  # rota -> [requisições, us total, us máximo, erros]
+        self.gc_runs = 0  # Coletas explícitas (collect)
+        self.gc_during_requests = 0  # Requisições em que a memória livre aumentou
+        self.gc_max_us = 0
+        self.min_free = gc.mem_free()
+        self.last_error = None
+
+    def begin(self):
+        """Marca o início de uma requisição"""
+        return (time.ticks_us(), gc.mem_free(), gc.mem_alloc())
+
+    def end(self, start, path, error=None):
+        """Registra uma requisição iniciada por begin()"""
+        ticks, free, alloc = start
+        elapsed = time.ticks_diff(time.ticks_us(), ticks)
+        free_now = gc.mem_free()
+        route = route_of(path)
+
+        slot = self.count % self.size
+        self.routes[slot] = route
+        self.durations[slot] = elapsed
+        self.free_before[slot] = free
+        self.free_after[slot] = free_now
+        self.alloc_before[slot] = alloc
+        self.alloc_after[slot] = gc.mem_alloc()
+        self.count += 1
+
+        if free_now > free:
+            self.gc_during_requests += 1
+        if free_now < self.min_free:
+            self.min_free = free_now
+
+        stats = self.endpoints.get(route)
+        if stats is None:
+            stats = self.endpoints[route] = [0, 0, 0, 0]
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+        if error is not None:
+            stats[3] += 1
+            self.last_error = f"{route}: {error}"
+
+    def collect(self):
+        """gc.collect() com contagem e duração"""
+        start = time.ticks_us()
+        gc.collect()
+        elapsed = time.ticks_diff(time.ticks_us(), start)
+        self.gc_runs += 1
+        if elapsed > self.gc_max_us:
+            self.gc_max_us = elapsed
+
+    def recent(self):
+        """Requisições do buffer, da mais antiga à mais recente"""
+        items = []
+        for seq in range(max(0, self.count - self.size), self.count):
+            slot = seq % self.size
+            items.append({
+                'route': self.routes[slot],
+                'us': self.durations[slot],
+                'free_before': self.free_before[slot],
+                'free_after': self.free_after[slot],
+                'alloc_before': self.alloc_before[slot],
+                'alloc_after': self.alloc_after[slot]
+            })
+        return items
+
+    def report(self):
+        endpoints = {}
+        for route, (count, total, longest, errors) in self.endpoints.items():
+            endpoints[route] = {
+                'count': count,
+                'avg_us': total // count,
+                'max_us': longest,
+                'errors': errors
+            }
+        return {
+            'requests': self.count,
+            'endpoints': endpoints,
+            'recent': self.recent(),
+            'last_error': self.last_error,
+            'gc': {
+                'runs': self.gc_runs,
+                'max_us': self.gc_max_us,
+                'during_requests': self.gc_during_requests,
+                'min_free': self.min_free
+            }
+        }
+
+
+def memory_info():
+    """Heap do MicroPython e maior bloco livre do heap do IDF"""
+    info = {'free': gc.mem_free(), 'alloc': gc.mem_alloc()}
+    if esp32:
+        heaps = esp32.idf_heap_info(esp32.HEAP_DATA)
+        # (total, livre, maior bloco livre, mínimo livre) por região
+        info['largest_free_block'] = max(h[2] for h in heaps) if heaps else 0
+        info['idf_min_free'] = sum(h[3] for h in heaps)
+    if machine:
+        info['reset_cause'] = machine.reset_cause()
+    return info
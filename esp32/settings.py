@@ -0,0 +1,36 @@
+import json
+
+SETTINGS_FILE = 'settings.json'
+
+# Valores padrão; settings.json precisa conter apenas o que for alterado
+DEFAULTS = {
+    'history_capacity': 2000,  # Quadros no histórico (17 bytes cada)
+    'history_payload_bytes': 8192,  # Área de payloads das mensagens TP remontadas
+    'tp_sessions': 4,  # Sessões TP simultâneas (1785 bytes cada)
+    'snapshot_entries': 128,  # Pares (PGN, origem) na tabela de /snapshot
+    'capture_capacity': 256,  # Quadros no buffer da IRQ
+    'capture_mode': 'irq',  # 'irq' ou 'thread' (laço de captura em _thread)
+    'stream_port': 8081,  # Porta do streaming binário
+    'log_enabled': False,  # Grava os quadros na flash (diretório log/)
+    'log_offline_only': True,  # Grava só sem WiFi e sem clientes recebendo quadros
+    'log_segment_bytes': 65536,  # Tamanho de cada segmento de log
+    'log_max_segments': 16,  # Segmentos mantidos antes de apagar o mais antigo
+    'profiler_enabled': False,  # Tempo e memória por requisição em /debug
+    'profiler_size': 32,  # Requisições guardadas pelo profiler
+    'wifi_static_ip': False,  # Reconexão rápida reutiliza o IP do último DHCP
+    'ap_ssid': 'JohnDeere-AP',  # Rede do modo AP (configuração WiFi)
+    'ap_password': '12345678',
+    'can_bitrate': 250000,  # 125000, 250000 (J1939) ou 500000 (J1939-14)
+    'filter_pgns': []  # PGNs aceitos desde o boot (vazio = todos)
+}
+
+
+def load_settings():
+    """Carrega settings.json mesclado com os valores padrão"""
+    settings = dict(DEFAULTS)
+    try:
+        with open(SETTINGS_FILE, 'r') as f:
+            settings.update(json.load(f))
+    except:
+        print("Usando configurações padrão")
+    return settings
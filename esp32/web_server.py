@@ -1,495 +1,416 @@
-import socket
+import asyncio
+import binascii
+import hashlib
 import json
+import os
+import time
+from http_request import BadRequest, RequestReader, read_request, response_head
+from profiler import Profiler, memory_info
+from websocket import WebSocketClient, handshake_response
+
+MAX_BATCH = 200  # Limite de quadros por resposta de /data
+FILE_CHUNK = 1024  # Bytes lidos da flash por escrita (logs e páginas)
+WWW_DIR = 'www'  # Páginas gzip geradas por tools/upload_files.py
+MAX_WS_CLIENTS = 4  # Navegadores conectados via WebSocket
+KEEPALIVE_TIMEOUT = 10  # Segundos ociosos antes de fechar uma conexão persistente
+MAX_KEEPALIVE_REQUESTS = 100  # Requisições por conexão antes de fechá-la
+WS_BATCH = 50  # Quadros por mensagem WebSocket
+
+def load_assets(directory=WWW_DIR):
+    """Páginas .gz disponíveis: nome -> (caminho, tamanho, ETag)"""
+    assets = {}
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        print(f"Diretório {directory}/ não encontrado")
+        return assets
+    chunk = bytearray(FILE_CHUNK)
+    for name in names:
+        if not name.endswith('.gz'):
+            continue
+        path = f"{directory}/{name}"
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            while True:
+                n = f.readinto(chunk)
+                if not n:
+                    break
+                digest.update(memoryview(chunk)[:n])
+        etag = '"' + binascii.hexlify(digest.digest()[:8]).decode() + '"'
+        assets[name[:-3]] = (path, os.stat(path)[6], etag)
+    return assets
 
 class WebServer:
-    def __init__(self, wifi_manager, can_handler):
+    def __init__(self, wifi_manager, can_handler, capture, history, table=None, log=None):
         self.wifi_manager = wifi_manager
         self.can_handler = can_handler
-        self.socket = None
-        self.can_data = []
+        self.capture = capture
+        self.history = history
+        self.table = table
+        self.log = log
+        self.profiler = None  # Profiler quando ativado (enable_profiler)
+        self.assets = load_assets()  # ETag calculado uma vez na inicialização
+        self.server = None
         self.monitoring = True  # Começa monitorando automaticamente
+        self.ws_clients = []
+        self._status_json = None
+        self._status_checked = time.ticks_ms()
+        self._started = time.ticks_ms()
+        # Amostra anterior de /metrics: (ticks, quadros capturados, bits)
+        self._metrics_sample = (self._started, 0, 0)
     
-    def start(self):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.bind(('', 80))
-        self.socket.listen(5)
+    async def start(self):
+        self.server = await asyncio.start_server(self.serve, '0.0.0.0', 80, backlog=5)
         print('Servidor web iniciado na porta 80')
     
-    def handle_request(self, client):
+    def poll_can(self):
+        """Move quadros capturados para o histórico"""
+        return self.capture.transfer(self.history)
+    
+    def enable_profiler(self, enabled, size=32):
+        """Liga ou desliga o profiler de requisições"""
+        if not enabled:
+            self.profiler = None
+        elif self.profiler is None:
+            self.profiler = Profiler(size)
+    
+    async def serve(self, reader, writer):
+        """Atende uma conexão HTTP/1.1 (uma tarefa por cliente)
+
+        A conexão continua aberta entre requisições (keep-alive) até o
+        cliente pedir 'Connection: close', ficar ocioso por
+        KEEPALIVE_TIMEOUT segundos ou atingir MAX_KEEPALIVE_REQUESTS.
+        """
+        taken = False  # Conexão passou para o WebSocket
+        reader = RequestReader(reader)
         try:
-            request = client.recv(1024).decode()
-            
-            # Verifica se está no modo AP ou Station
-            status = self.wifi_manager.get_status()
-            is_ap_mode = status['ap_active']
+            for count in range(MAX_KEEPALIVE_REQUESTS):
+                try:
+                    request = await read_request(reader, KEEPALIVE_TIMEOUT)
+                except (BadRequest, ValueError, UnicodeError) as e:
+                    writer.write(response_head(getattr(e, 'status', 400)))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                # Última requisição permitida na conexão é respondida com close
+                keep_alive = request.keep_alive and count < MAX_KEEPALIVE_REQUESTS - 1
+                taken = await self.handle(request, reader, writer, keep_alive)
+                if taken or not keep_alive:
+                    break
+        except OSError:
+            pass
+        finally:
+            if not taken:
+                await self.close_connection(writer)
+    
+    async def handle(self, request, reader, writer, keep_alive):
+        """Responde uma requisição; retorna True se a conexão virou WebSocket"""
+        taken = False
+        error = None
+        profiler = self.profiler
+        if profiler:
+            started = profiler.begin()
+        try:
+            method = request.method
+            path = request.path
             
-            if "GET /scan" in request:
-                networks = self.wifi_manager.scan_networks()
-                self.send_json_response(client, {"networks": networks})
-                
-            elif "POST /connect" in request:
-                body = request.split('\r\n\r\n')[1]
-                config = json.loads(body)
-                success = self.wifi_manager.connect_wifi(config['ssid'], config['password'])
-                
-                # Carrega configuração salva para pegar o IP
-                saved_config = self.wifi_manager.load_config()
-                new_ip = saved_config.get('last_ip') if saved_config else None
+            if path == "/scan":
+                # Resultado em cache; a busca roda em segundo plano
+                await self.send_json_response(writer, self.wifi_manager.scan_networks(), keep_alive)
                 
-                self.send_json_response(client, {
-                    "status": "success" if success else "error",
-                    "ip": new_ip,
+            elif path == "/connect" and method == "POST":
+                config = request.json()
+                if not config.get('ssid'):
+                    raise BadRequest('ssid ausente')
+                # Responde na hora; o progresso é acompanhado em /status (state)
+                connecting = self.wifi_manager.connect_wifi(config['ssid'], config.get('password', ''))
+                await self.send_json_response(writer, {
+                    "status": "connecting" if connecting else "error",
                     "ssid": config['ssid']
-                })
+                }, keep_alive)
                     
-            elif "GET /status" in request:
-                self.send_json_response(client, self.wifi_manager.get_status())
+            elif path == "/filters" and method == "POST":
+                config = request.json()
+                result = self.capture.set_filters(config.get('pgns'), config.get('sources'))
+                result['status'] = 'success'
+                await self.send_json_response(writer, result, keep_alive)
+                
+            elif path == "/status":
+                await self.send_json_response(writer, self.get_status(), keep_alive)
+                
+            elif path == "/ws":
+                taken = await self.open_websocket(reader, writer, request)
+                
+            elif path == "/snapshot":
+                self.poll_can()
+                await self.send_json_response(writer, self.get_snapshot(), keep_alive)
                 
-            elif "GET /data" in request:
-                data = self.can_handler.read_message()
-                if data:
-                    self.can_data.append(data)
-                    if len(self.can_data) > 100:  # Mantém apenas últimas 100 mensagens
-                        self.can_data.pop(0)
-                self.send_json_response(client, {
-                    "current": data,
-                    "history": self.can_data
-                })
+            elif path == "/debug":
+                params = request.query
+                if 'profile' in params:
+                    self.enable_profiler(params['profile'] == '1')
+                await self.send_json_response(writer, self.get_debug(), keep_alive)
+                
+            elif path == "/metrics":
+                self.poll_can()
+                await self.send_json_response(writer, self.get_metrics(), keep_alive)
+                
+            elif path.startswith("/log/"):
+                await self.send_log_segment(writer, path[len('/log/'):], keep_alive)
+                
+            elif path == "/log":
+                await self.send_json_response(writer, self.get_log_index(), keep_alive)
+                
+            elif path == "/data":
+                self.poll_can()
+                await self.send_json_response(writer, self.get_frames(request.query), keep_alive)
                 
             else:
-                if is_ap_mode:
-                    self.send_ap_page(client)
+                # Verifica se está no modo AP ou Station
+                status = self.wifi_manager.get_status()
+                if status['ap_active']:
+                    await self.send_page(writer, request, 'ap.html', keep_alive)
                 else:
-                    self.send_monitor_page(client)
+                    await self.send_page(writer, request, 'monitor.html', keep_alive)
             
+        except OSError:
+            raise
+        except BadRequest as e:
+            # Corpo inválido (JSON): a conexão continua utilizável
+            writer.write(response_head(e.status, keep_alive=keep_alive))
+            await writer.drain()
         except Exception as e:
             print(f"Erro ao processar requisição: {e}")
+            error = e
+            writer.write(response_head(500))
+            await writer.drain()
+            raise OSError  # Resposta pode ter sido interrompida: fecha a conexão
         finally:
-            client.close()
+            if profiler:
+                profiler.end(started, request.path, error)
+        return taken
     
-    def send_json_response(self, client, data):
-        response = json.dumps(data)
-        client.send('HTTP/1.1 200 OK\n')
-        client.send('Content-Type: application/json\n')
-        client.send('Connection: close\n\n')
-        client.send(response)
+    async def close_connection(self, writer):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except OSError:
+            pass
     
-    def send_ap_page(self, client):
-        """Página de configuração do WiFi (modo AP)"""
-        html = """<!DOCTYPE html>
-        <html>
-        <head>
-            <title>Configuração WiFi - John Deere Monitor</title>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1">
-            <style>
-                body { 
-                    font-family: Arial; 
-                    margin: 0;
-                    padding: 20px;
-                    background: #367C2B;
-                    color: white;
-                }
-                .container {
-                    max-width: 600px;
-                    margin: 0 auto;
-                    background: rgba(255,255,255,0.1);
-                    padding: 20px;
-                    border-radius: 10px;
-                    box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-                }
-                h1 { 
-                    text-align: center;
-                    color: #FFDE00;
-                }
-                .logo {
-                    text-align: center;
-                    margin-bottom: 20px;
-                }
-                .wifi-form {
-                    max-width: 400px;
-                    margin: 0 auto;
-                }
-                select, input {
-                    width: 100%;
-                    padding: 12px;
-                    margin: 8px 0;
-                    border: none;
-                    border-radius: 5px;
-                    background: white;
-                    box-sizing: border-box;
-                    font-size: 16px;
-                }
-                .btn {
-                    background: #FFDE00;
-                    color: #367C2B;
-                    padding: 12px 20px;
-                    border: none;
-                    border-radius: 5px;
-                    cursor: pointer;
-                    width: 100%;
-                    font-weight: bold;
-                    font-size: 16px;
-                    margin-top: 15px;
-                }
-                .btn:hover {
-                    background: #FFE534;
-                }
-                #status {
-                    padding: 15px;
-                    margin: 15px 0;
-                    border-radius: 5px;
-                    display: none;
-                    text-align: center;
-                    line-height: 1.5;
-                }
-                .success { 
-                    background: #4CAF50;
-                    color: white;
-                }
-                .error { 
-                    background: #f44336;
-                    color: white;
-                }
-                .pending {
-                    background: #FFC107;
-                    color: #333;
-                }
-                small {
-                    font-size: 0.85em;
-                    opacity: 0.9;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="logo">
-                    <h1>John Deere Monitor</h1>
-                    <p>Configuração de Rede WiFi</p>
-                </div>
-                
-                <div class="wifi-form">
-                    <select id="ssid">
-                        <option value="">Buscando redes...</option>
-                    </select>
-                    <input type="password" id="password" placeholder="Senha da rede">
-                    <button class="btn" onclick="connectWifi()">Conectar</button>
-                    <div id="status"></div>
-                </div>
-            </div>
-
-            <script>
-                let statusElement;
-                
-                window.onload = function() {
-                    statusElement = document.getElementById('status');
-                    // Busca redes disponíveis
-                    updateNetworks();
-                    // Verifica status atual
-                    checkCurrentStatus();
-                }
-
-                function updateNetworks() {
-                    fetch('/scan')
-                        .then(response => response.json())
-                        .then(data => {
-                            const select = document.getElementById('ssid');
-                            select.innerHTML = '';
-                            data.networks.forEach(net => {
-                                const option = document.createElement('option');
-                                option.value = option.text = net;
-                                select.add(option);
-                            });
-                        })
-                        .catch(error => showStatus('Erro ao buscar redes', false));
-                }
-
-                function checkCurrentStatus() {
-                    fetch('/status')
-                        .then(response => response.json())
-                        .then(status => {
-                            if (status.sta_connected) {
-                                showStatus(`Conectado à rede WiFi<br>IP Local: ${status.sta_ip}`, true);
-                            }
-                        });
-                }
-
-                function connectWifi() {
-                    const ssid = document.getElementById('ssid').value;
-                    const password = document.getElementById('password').value;
-                    
-                    if (!ssid || !password) {
-                        showStatus('Preencha todos os campos', false);
-                        return;
-                    }
-
-                    showStatus(`
-                        Conectando à rede: ${ssid}<br>
-                        Por favor, aguarde...
-                    `, 'pending');
-                    
-                    fetch('/connect', {
-                        method: 'POST',
-                        body: JSON.stringify({ssid, password})
-                    })
-                    .then(response => response.json())
-                    .then(data => {
-                        if (data.status === 'success') {
-                            showStatus(`
-                                Conexão em andamento...<br>
-                                Aguarde alguns segundos e verifique<br>
-                                o novo dispositivo adicionado à sua rede local
-                            `, 'pending');
-                        } else {
-                            showStatus(`
-                                Falha na conexão<br>
-                                Verifique a senha e tente novamente
-                            `, false);
-                        }
-                    })
-                    .catch(() => {
-                        showStatus(`
-                            Conexão em andamento...<br>
-                            Aguarde alguns segundos e verifique<br>
-                            o novo dispositivo adicionado à sua rede local
-                        `, 'pending');
-                    });
-                }
-
-                function showStatus(message, type) {
-                    if (!statusElement) return;
-                    
-                    statusElement.innerHTML = message;
-                    statusElement.className = '';
-                    statusElement.style.display = 'block';
-                    
-                    if (type === true) {
-                        statusElement.classList.add('success');
-                    } else if (type === false) {
-                        statusElement.classList.add('error');
-                    } else if (type === 'pending') {
-                        statusElement.classList.add('pending');
-                    }
-                }
-            </script>
-        </body>
-        </html>
-        """
-        client.send('HTTP/1.1 200 OK\n')
-        client.send('Content-Type: text/html; charset=utf-8\n')
-        client.send('Connection: close\n\n')
-        client.send(html)
+    def get_status(self):
+        """Status do WiFi e ocupação do histórico"""
+        status = self.wifi_manager.get_status()
+        status['history'] = self.history.get_stats()
+        if self.log:
+            status['log'] = self.log.get_stats()
+        return status
     
-    def send_monitor_page(self, client):
-        """Página de monitoramento CAN (modo Station)"""
-        html = """<!DOCTYPE html>
-        <html>
-        <head>
-            <title>Monitor CAN Bus - John Deere</title>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1">
-            <style>
-                body { 
-                    font-family: Arial; 
-                    margin: 0;
-                    padding: 20px;
-                    background: #367C2B;
-                    color: white;
-                }
-                .container {
-                    max-width: 1200px;
-                    margin: 0 auto;
-                    background: rgba(255,255,255,0.1);
-                    padding: 20px;
-                    border-radius: 10px;
-                    box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-                }
-                .header {
-                    text-align: center;
-                    margin-bottom: 30px;
-                    padding-bottom: 20px;
-                    border-bottom: 1px solid rgba(255,255,255,0.2);
-                }
-                h1 { 
-                    color: #FFDE00;
-                    margin: 0;
-                    font-size: 2.2em;
-                }
-                .status-bar {
-                    background: rgba(255,255,255,0.15);
-                    padding: 15px;
-                    border-radius: 8px;
-                    margin-bottom: 20px;
-                    text-align: center;
-                    font-size: 1.1em;
-                }
-                .data-grid {
-                    display: grid;
-                    grid-template-columns: repeat(auto-fit, minmax(300px, 1fr));
-                    gap: 20px;
-                    margin-bottom: 30px;
-                }
-                .data-card {
-                    background: rgba(255,255,255,0.1);
-                    padding: 20px;
-                    border-radius: 8px;
-                    border: 1px solid rgba(255,255,255,0.2);
-                    transition: all 0.3s ease;
-                }
-                .data-card:hover {
-                    transform: translateY(-5px);
-                    background: rgba(255,255,255,0.15);
-                }
-                .data-card h3 {
-                    color: #FFDE00;
-                    margin: 0 0 15px 0;
-                    font-size: 1.3em;
-                }
-                .value { 
-                    font-size: 28px;
-                    color: white;
-                    font-weight: bold;
-                    text-align: center;
-                    font-family: monospace;
-                }
-                .data-history {
-                    background: rgba(0,0,0,0.2);
-                    padding: 20px;
-                    border-radius: 8px;
-                    margin-top: 20px;
-                    height: 300px;
-                    overflow-y: auto;
-                }
-                .data-history h2 {
-                    color: #FFDE00;
-                    margin: 0 0 15px 0;
-                }
-                .history-item {
-                    background: rgba(255,255,255,0.1);
-                    padding: 10px;
-                    margin: 5px 0;
-                    border-radius: 5px;
-                    font-family: monospace;
-                }
-                .history-item:hover {
-                    background: rgba(255,255,255,0.15);
-                }
-                .connected { color: #4CAF50; }
-                .disconnected { color: #f44336; }
-                
-                /* Scrollbar personalizada */
-                ::-webkit-scrollbar {
-                    width: 10px;
-                }
-                ::-webkit-scrollbar-track {
-                    background: rgba(255,255,255,0.1);
-                    border-radius: 5px;
-                }
-                ::-webkit-scrollbar-thumb {
-                    background: #FFDE00;
-                    border-radius: 5px;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Monitor CAN Bus John Deere</h1>
-                    <p>Sistema de Monitoramento de Implementos Agrícolas</p>
-                </div>
-                
-                <div class="status-bar" id="status-bar">
-                    Verificando conexão...
-                </div>
-                
-                <div class="data-grid" id="data-grid">
-                    <!-- Dados dinâmicos serão inseridos aqui -->
-                </div>
-                
-                <div class="data-history">
-                    <h2>Histórico de Mensagens</h2>
-                    <div id="data-history">
-                        <!-- Histórico será inserido aqui -->
-                    </div>
-                </div>
-            </div>
-
-            <script>
-                function updateStatus() {
-                    fetch('/status')
-                        .then(response => response.json())
-                        .then(status => {
-                            const statusBar = document.getElementById('status-bar');
-                            const isConnected = status.sta_connected;
-                            statusBar.innerHTML = `
-                                Status da Conexão: 
-                                <span class="${isConnected ? 'connected' : 'disconnected'}">
-                                    ${isConnected ? 'Conectado' : 'Desconectado'}
-                                </span> |
-                                IP: ${status.sta_ip || 'N/A'}
-                            `;
-                        });
-                }
-                
-                function updateData() {
-                    fetch('/data')
-                        .then(response => response.json())
-                        .then(data => {
-                            if (data.current) {
-                                updateDataGrid(data.current);
-                                updateHistory(data.history);
-                            }
-                        });
-                }
-                
-                function updateDataGrid(data) {
-                    const grid = document.getElementById('data-grid');
-                    grid.innerHTML = `
-                        <div class="data-card">
-                            <h3>PGN (Parameter Group Number)</h3>
-                            <div class="value">${data.pgn}</div>
-                        </div>
-                        <div class="data-card">
-                            <h3>Dados Recebidos</h3>
-                            <div class="value">${data.data.map(x => x.toString(16).padStart(2, '0')).join(' ')}</div>
-                        </div>
-                        <div class="data-card">
-                            <h3>Origem</h3>
-                            <div class="value">${data.source}</div>
-                        </div>
-                        <div class="data-card">
-                            <h3>Prioridade</h3>
-                            <div class="value">${data.priority}</div>
-                        </div>
-                    `;
-                }
-                
-                function updateHistory(history) {
-                    const historyDiv = document.getElementById('data-history');
-                    historyDiv.innerHTML = history.map(msg => `
-                        <div class="history-item">
-                            [${new Date(msg.timestamp).toLocaleTimeString('pt-BR')}] 
-                            PGN: ${msg.pgn} | 
-                            Origem: ${msg.source} | 
-                            Dados: ${msg.data.map(x => x.toString(16).padStart(2, '0')).join(' ')}
-                        </div>
-                    `).join('');
-                    historyDiv.scrollTop = historyDiv.scrollHeight;
-                }
-                
-                // Atualiza status a cada 5 segundos
-                setInterval(updateStatus, 5000);
-                // Atualiza dados CAN a cada 1 segundo
-                setInterval(updateData, 1000);
-                
-                // Primeira atualização
-                updateStatus();
-                updateData();
-            </script>
-        </body>
-        </html>
+    def refresh_status(self):
+        """Status em JSON, recalculado no máximo uma vez por segundo"""
+        now = time.ticks_ms()
+        if self._status_json is None or time.ticks_diff(now, self._status_checked) >= 1000:
+            self._status_checked = now
+            self._status_json = json.dumps(self.get_status())
+        return self._status_json
+    
+    async def open_websocket(self, reader, writer, request):
+        """Aceita o upgrade para WebSocket; retorna True se a conexão fica aberta"""
+        key = request.header('Sec-WebSocket-Key')
+        if not key:
+            writer.write(response_head(400))
+            await writer.drain()
+            return False
+        if len(self.ws_clients) >= MAX_WS_CLIENTS:
+            writer.write(response_head(503))
+            await writer.drain()
+            return False
+        
+        writer.write(handshake_response(key).encode())
+        await writer.drain()
+        # Começa pelos últimos quadros para preencher a página
+        cursor = max(self.history.first_seq, self.history.next_seq - WS_BATCH)
+        ws = WebSocketClient(reader, writer, cursor)
+        self.ws_clients.append(ws)
+        print(f"WebSocket conectado ({len(self.ws_clients)}/{MAX_WS_CLIENTS})")
+        asyncio.create_task(self.run_websocket(ws))
+        return True
+    
+    async def run_websocket(self, ws):
+        """Envia quadros novos e mudanças de status a um cliente WebSocket"""
+        asyncio.create_task(ws.listen())
+        try:
+            while not ws.closed:
+                status = self.refresh_status()
+                if ws.pong is not None:
+                    await ws.send_pong()
+                elif ws.status != status:
+                    ws.status = status
+                    await ws.send('{"type": "status", "status": ' + status + '}')
+                elif ws.cursor < self.history.next_seq:
+                    result = self.get_frames({'since': ws.cursor, 'max': WS_BATCH})
+                    ws.cursor = result['next']
+                    await ws.send(json.dumps({
+                        "type": "frames",
+                        "frames": result['frames'],
+                        "lost": result['lost']
+                    }))
+                else:
+                    await asyncio.sleep_ms(100)
+        except OSError:
+            pass
+        await ws.close()
+        await self.close_connection(ws.writer)
+        self.ws_clients.remove(ws)
+    
+    def get_snapshot(self):
+        """Último valor de cada (PGN, origem); tamanho independe do histórico"""
+        if self.table is None:
+            return {"entries": [], "timestamp": time.ticks_ms()}
+        return {
+            "entries": self.table.snapshot(),
+            "timestamp": time.ticks_ms(),
+            "table": self.table.get_stats()
+        }
+    
+    def get_frames(self, params):
+        """Quadros com sequência >= since (ou os mais recentes sem since)"""
+        history = self.history
+        try:
+            since = max(0, int(params['since'])) if 'since' in params else None
+            limit = max(1, min(int(params.get('max', 100)), MAX_BATCH))
+        except ValueError:
+            since, limit = None, 100
+        
+        # Cursor à frente do histórico: o ESP32 reiniciou, recomeça do início
+        if since is not None and since > history.next_seq:
+            since = history.first_seq
+        
+        # Quadros sobrescritos antes de serem lidos pelo cliente
+        lost = max(0, history.first_seq - since) if since is not None else 0
+        
+        frames = []
+        for seq, frame in history.frames(since=since, limit=limit):
+            item = frame.to_dict()
+            item['seq'] = seq
+            frames.append(item)
+        
+        # Mensagens longas com payload sobrescrito são puladas: contam como
+        # perdidas e o cursor avança até o fim da janela mesmo assim
+        start, end = history.window(since, limit)
+        lost += end - start - len(frames)
+        
+        return {
+            "frames": frames,
+            "next": end,
+            "lost": lost,
+            "capture": self.capture.get_stats()
+        }
+    
+    def get_metrics(self):
+        """Saúde do MCP2515, taxa, carga do barramento e contadores da captura
+        
+        Taxas são medidas desde a chamada anterior de /metrics. A carga
+        considera só os quadros que passaram pelos filtros de hardware.
         """
-        client.send('HTTP/1.1 200 OK\n')
-        client.send('Content-Type: text/html; charset=utf-8\n')
-        client.send('Connection: close\n\n')
-        client.send(html) 
\ No newline at end of file
+        now = time.ticks_ms()
+        capture = self.capture.get_stats()
+        last_ticks, last_frames, last_bits = self._metrics_sample
+        self._metrics_sample = (now, capture['captured'], capture['bus_bits'])
+        elapsed = time.ticks_diff(now, last_ticks) / 1000
+        fps = (capture['captured'] - last_frames) / elapsed if elapsed > 0 else 0
+        bits = (capture['bus_bits'] - last_bits) / elapsed if elapsed > 0 else 0
+        
+        metrics = {
+            "uptime_ms": time.ticks_diff(now, self._started),
+            "interval_s": round(elapsed, 2),
+            "frames_per_sec": round(fps, 1),
+            "bus_load_percent": round(100 * bits / self.can_handler.bitrate, 1),
+            "bitrate": self.can_handler.bitrate,
+            "hardware_filter": self.capture.filter_pgns is not None,
+            "controller": self.capture.read_controller_state(),
+            "capture": capture,
+            "history": self.history.get_stats()
+        }
+        if self.capture.tp:
+            metrics["tp"] = self.capture.tp.get_stats()
+        if self.table is not None:
+            metrics["pgn_counts"] = self.table.pgn_counts()
+            metrics["table"] = self.table.get_stats()
+        if self.log:
+            metrics["log"] = self.log.get_stats()
+        return metrics
+    
+    def get_debug(self):
+        """Memória e, com o profiler ligado, tempos por rota"""
+        debug = {
+            "memory": memory_info(),
+            "profiler": self.profiler is not None
+        }
+        if self.profiler:
+            debug.update(self.profiler.report())
+        return debug
+    
+    def get_log_index(self):
+        """Segmentos de log gravados na flash"""
+        if self.log is None:
+            return {"segments": []}
+        return {
+            "segments": self.log.get_segments(),
+            "stats": self.log.get_stats()
+        }
+    
+    async def send_log_segment(self, writer, name, keep_alive=False):
+        """Envia um segmento de log lendo a flash em blocos de FILE_CHUNK"""
+        path = self.log.find(name) if self.log else None
+        if path is None:
+            writer.write(response_head(404, keep_alive=keep_alive))
+            await writer.drain()
+            return
+        
+        size = os.stat(path)[6]
+        writer.write(response_head(200, 'application/octet-stream', size, keep_alive))
+        # Para no tamanho do início: o segmento atual pode crescer durante o envio
+        await self.send_file(writer, path, size)
+    
+    async def send_file(self, writer, path, size):
+        """Envia size bytes de um arquivo em blocos de FILE_CHUNK"""
+        chunk = bytearray(FILE_CHUNK)
+        view = memoryview(chunk)
+        sent = 0
+        with open(path, 'rb') as f:
+            while sent < size:
+                n = f.readinto(chunk)
+                if not n:
+                    break
+                n = min(n, size - sent)
+                writer.write(view[:n])
+                await writer.drain()
+                sent += n
+    
+    async def send_json_response(self, writer, data, keep_alive=False):
+        """Cabeçalhos e corpo em uma única escrita (um segmento TCP)"""
+        body = json.dumps(data).encode()
+        writer.write(response_head(200, 'application/json', len(body), keep_alive) + body)
+        await writer.drain()
+    
+    async def send_page(self, writer, request, name, keep_alive=False):
+        """Envia uma página gzip de www/; 304 se o navegador já tem a versão"""
+        asset = self.assets.get(name)
+        if asset is None:
+            body = b'Pagina nao encontrada: envie www/ com tools/upload_files.py'
+            writer.write(response_head(404, 'text/plain', len(body), keep_alive) + body)
+            await writer.drain()
+            return
+        
+        path, size, etag = asset
+        if request.header('If-None-Match') == etag:
+            writer.write(response_head(304, keep_alive=keep_alive, extra=f'ETag: {etag}\r\n'))
+            await writer.drain()
+            return
+        
+        # A mesma URL (/) serve a página AP ou a de monitoramento: o
+        # navegador revalida com o ETag em vez de usar o cache por tempo
+        extra = f'Content-Encoding: gzip\r\nCache-Control: no-cache\r\nETag: {etag}\r\n'
+        writer.write(response_head(200, 'text/html; charset=utf-8', size, keep_alive, extra))
+        await self.send_file(writer, path, size)
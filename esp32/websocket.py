@@ -0,0 +1,112 @@
+import binascii
+import hashlib
+import struct
+
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+MAX_CONTROL = 125  # Payload máximo de quadros de controle (RFC 6455)
+SKIP_CHUNK = 128  # Bytes descartados por leitura de mensagens ignoradas
+
+
+def accept_key(key):
+    """Calcula Sec-WebSocket-Accept para a chave do cliente"""
+    digest = hashlib.sha1(key.encode() + WS_GUID).digest()
+    return binascii.b2a_base64(digest).strip().decode()
+
+
+def handshake_response(key):
+    return (
+        'HTTP/1.1 101 Switching Protocols\r\n'
+        'Upgrade: websocket\r\n'
+        'Connection: Upgrade\r\n'
+        f'Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n'
+    )
+
+
+def encode_frame(payload, opcode=OP_TEXT):
+    """Monta um quadro WebSocket (servidor não usa máscara)"""
+    size = len(payload)
+    if size < 126:
+        header = struct.pack('!BB', 0x80 | opcode, size)
+    elif size < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, size)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, size)
+    return header + payload
+
+
+class WebSocketClient:
+    """Navegador conectado via WebSocket
+
+    O envio de uma nova mensagem espera o drain da anterior, então o buffer
+    de saída de cada cliente nunca passa de uma mensagem; clientes lentos
+    ficam para trás no cursor do histórico em vez de acumular memória.
+    """
+
+    def __init__(self, reader, writer, cursor):
+        self.reader = reader
+        self.writer = writer
+        self.cursor = cursor  # Próxima sequência do histórico a enviar
+        self.status = None  # Último status enviado
+        self.closed = False
+        self.pong = None  # Payload do ping recebido aguardando resposta
+
+    async def send(self, message):
+        """Envia uma mensagem de texto (JSON)"""
+        self.writer.write(encode_frame(message.encode()))
+        await self.writer.drain()
+
+    async def listen(self):
+        """Trata quadros recebidos do navegador (close/ping)
+
+        Lê o cabeçalho de cada quadro (2 a 14 bytes) para saber o tamanho
+        e a máscara; o payload de pings é guardado para o pong e o das
+        demais mensagens é descartado em blocos.
+        """
+        reader = self.reader
+        try:
+            while not self.closed:
+                header = await reader.readexactly(2)
+                opcode = header[0] & 0x0F
+                size = header[1] & 0x7F
+                if size == 126:
+                    size = struct.unpack('!H', await reader.readexactly(2))[0]
+                elif size == 127:
+                    size = struct.unpack('!Q', await reader.readexactly(8))[0]
+                mask = await reader.readexactly(4) if header[1] & 0x80 else None
+
+                if opcode == OP_PING and size <= MAX_CONTROL:
+                    payload = bytearray(await reader.readexactly(size))
+                    if mask:
+                        for i in range(size):
+                            payload[i] ^= mask[i & 3]
+                    self.pong = bytes(payload)
+                    continue
+                while size:
+                    chunk = await reader.read(min(size, SKIP_CHUNK))
+                    if not chunk:
+                        raise EOFError
+                    size -= len(chunk)
+                if opcode == OP_CLOSE:
+                    break
+        except (OSError, EOFError):
+            pass
+        self.closed = True
+
+    async def send_pong(self):
+        """Responde o último ping com o mesmo payload"""
+        payload = self.pong
+        self.pong = None
+        self.writer.write(encode_frame(payload, OP_PONG))
+        await self.writer.drain()
+
+    async def close(self):
+        self.closed = True
+        try:
+            self.writer.write(encode_frame(b'', OP_CLOSE))
+            await self.writer.drain()
+        except OSError:
+            pass
@@ -1,18 +1,72 @@
 import network
+import binascii
 import json
+import time
 from time import sleep
 
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+SCAN_TTL_MS = 30000  # Validade do resultado da busca de redes
+CONNECT_TIMEOUT_MS = 20000  # Tentativa de conexão antes de voltar ao AP
+FAST_CONNECT_TIMEOUT_MS = 3000  # Tentativa com BSSID/canal salvos antes da conexão completa
+RETRY_MIN_MS = 1000  # Espera inicial entre tentativas de reconexão (dobra a cada falha)
+RETRY_MAX_MS = 120000  # Espera máxima: cada tentativa tira o rádio do canal do AP
+AP_GRACE_MS = 10000  # AP continua ativo após conectar (página mostra o novo IP)
+
+# Estados da conexão da estação
+IDLE = 'idle'
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+FAILED = 'failed'
+
+# Códigos de station.status() que encerram a tentativa antes do timeout
+FAIL_STATUS = tuple(getattr(network, name) for name in
+                    ('STAT_WRONG_PASSWORD', 'STAT_NO_AP_FOUND', 'STAT_CONNECT_FAIL')
+                    if hasattr(network, name))
+AUTH_MODES = ('aberta', 'WEP', 'WPA-PSK', 'WPA2-PSK', 'WPA/WPA2-PSK',
+              'WPA2-Enterprise', 'WPA3-PSK', 'WPA2/WPA3-PSK')
+
 class WiFiManager:
-    def __init__(self, ap_ssid="JohnDeere-AP", ap_password="12345678"):
+    def __init__(self, ap_ssid="JohnDeere-AP", ap_password="12345678", static_ip=False):
         self.ap_ssid = ap_ssid
         self.ap_password = ap_password
+        self.static_ip = static_ip  # Reutiliza o IP do último DHCP (sem nova concessão)
         self.ap = None
         self.station = None
         self.config_file = 'wifi_config.json'
+        self.config = self.load_config()
+        
+        # Status em cache, atualizado nos eventos de conexão (refresh_status)
+        self.status = None
+        
+        # Máquina de estados da conexão (avançada por supervise)
+        self.state = IDLE
+        self.ssid = None
+        self.password = None
+        self.error = None
+        self.state_since = time.ticks_ms()
+        self.ap_off_at = None  # ticks_ms para desligar o AP após conectar
+        
+        # Reconexão (watchdog em supervise)
+        self.fast = False  # Tentativa atual usa BSSID/canal/IP salvos
+        self.retry = False  # Credenciais já funcionaram: reconecta sozinho
+        self.retry_at = None
+        self.backoff = RETRY_MIN_MS
+        self.attempt_since = None  # Início da tentativa (inclui o fallback)
+        self.reconnects = 0
+        self.last_connect_ms = None
         
-        # Primeiro tenta conectar na rede salva
+        # Busca de redes em segundo plano
+        self.networks = []
+        self.scan_time = None  # ticks_ms da última busca concluída
+        self.scanning = False
+        
+        # Primeiro tenta conectar na rede salva (sem bloquear); o AP só é
+        # iniciado se a tentativa falhar
         if not self.try_connect_saved():
-            # Se não conseguir conectar, inicia o AP
             self.start_ap()
 
     def start_ap(self):
@@ -35,75 +89,163 @@ class WiFiManager:
             print('SSID:', self.ap_ssid)
             print('Senha:', self.ap_password)
             print('IP do AP:', self.ap.ifconfig()[0])
+            # Deixa a lista de redes pronta para a página de configuração
+            self.start_scan()
         else:
             print('Falha ao iniciar Access Point')
+        self.refresh_status()
         return self.ap
 
-    def connect_wifi(self, ssid, password):
-        """Conecta a uma rede WiFi"""
-        print(f"\nTentando conectar à rede: {ssid}")
+    def connect_wifi(self, ssid, password, retry=False):
+        """Inicia a conexão a uma rede WiFi sem esperar o resultado
         
+        Com BSSID e canal salvos para a rede, tenta antes a conexão
+        rápida (e o IP salvo, se static_ip). O progresso aparece em
+        get_status()['state'] à medida que supervise() avança a máquina
+        de estados. Com retry, falhas são repetidas com backoff.
+        """
+        print(f"\nTentando conectar à rede: {ssid}")
+        self.ssid = ssid
+        self.password = password
+        self.retry = retry
+        self.error = None
+        self.backoff = RETRY_MIN_MS
+        self.attempt_since = time.ticks_ms()
+        self.fast = self._saved_link() is not None
+        return self._start_connect()
+
+    def _saved_link(self):
+        """Configuração salva da rede atual se tiver BSSID ou canal"""
+        config = self.config
+        if config and config.get('ssid') == self.ssid and (config.get('bssid') or config.get('channel')):
+            return config
+        return None
+
+    def _start_connect(self):
         # Mantém AP ativo durante a conexão
         if not self.station:
             self.station = network.WLAN(network.STA_IF)
-        
         self.station.active(True)
-        sleep(1)
         
-        # Tenta conectar
+        kwargs = {}
+        try:
+            # O watchdog controla as reconexões, não o driver
+            self.station.config(reconnects=0)
+        except:
+            pass
         try:
-            self.station.connect(ssid, password)
-            
-            # Aguarda conexão com timeout
-            timeout = 0
-            while not self.station.isconnected() and timeout < 20:
-                print('Tentando conectar...')
-                sleep(1)
-                timeout += 1
-            
             if self.station.isconnected():
-                ip = self.station.ifconfig()[0]
-                print('\nConectado com sucesso!')
-                print(f'IP: {ip}')
-                
-                # Salva configuração e IP
-                self.save_config(ssid, password, ip)
-                
-                # Mantém AP ativo por mais 10 segundos
-                sleep(10)
-                
-                if self.ap and self.ap.active():
-                    print("Desativando AP...")
-                    self.ap.active(False)
-                
-                return True
-                
-            print('\nFalha na conexão')
-            return False
-            
+                self.station.disconnect()
+            saved = self._saved_link() if self.fast else None
+            if saved:
+                if saved.get('bssid'):
+                    kwargs['bssid'] = binascii.unhexlify(saved['bssid'])
+                if saved.get('channel'):
+                    try:
+                        self.station.config(channel=saved['channel'])
+                    except:
+                        pass
+            if saved and self.static_ip and saved.get('ip_config'):
+                self.station.ifconfig(tuple(saved['ip_config']))  # Dispensa o DHCP
+            else:
+                try:
+                    self.station.ifconfig('dhcp')
+                except:
+                    pass
+            self.station.connect(self.ssid, self.password, **kwargs)
         except Exception as e:
             print(f'Erro ao conectar: {e}')
+            self._fail(str(e))
             return False
+        self._set_state(CONNECTING)
+        return True
+
+    def _ap_clients(self):
+        """Estações conectadas ao AP (0 se inativo ou sem suporte)"""
+        if not (self.ap and self.ap.active()):
+            return 0
+        try:
+            return len(self.ap.status('stations'))
+        except:
+            return 0
+
+    def _fail(self, error):
+        """Encerra a tentativa; agenda outra se as credenciais já funcionaram"""
+        if self.retry:
+            self.retry_at = time.ticks_add(time.ticks_ms(), self.backoff)
+            self.backoff = min(self.backoff * 2, RETRY_MAX_MS)
+        self._set_state(FAILED, error)
+
+    def _set_state(self, state, error=None):
+        self.state = state
+        self.state_since = time.ticks_ms()
+        if error:
+            self.error = error
+        self.refresh_status()
+
+    def _on_connected(self):
+        ip_config = self.station.ifconfig()
+        elapsed = time.ticks_diff(time.ticks_ms(), self.attempt_since)
+        self.last_connect_ms = elapsed
+        print(f"\nConectado com sucesso em {elapsed} ms{' (rápida)' if self.fast else ''}!")
+        print(f'IP: {ip_config[0]}')
+        
+        # BSSID da última busca (ou o já salvo) e canal para a próxima conexão rápida
+        bssid = None
+        for net in self.networks:
+            if net['ssid'] == self.ssid:
+                bssid = net['bssid'].replace(':', '')
+        if bssid is None and self.config and self.config.get('ssid') == self.ssid:
+            bssid = self.config.get('bssid')
+        try:
+            channel = self.station.config('channel')
+        except:
+            channel = None
+        
+        # Salva configuração, IP e dados do enlace (só se mudaram: poupa a flash)
+        config = {
+            'ssid': self.ssid,
+            'password': self.password,
+            'last_ip': ip_config[0],
+            'bssid': bssid,
+            'channel': channel,
+            'ip_config': list(ip_config)
+        }
+        if config != self.config:
+            self.save_config(**config)
+        self.retry = True
+        self.retry_at = None
+        self.backoff = RETRY_MIN_MS
+        self.error = None
+        
+        # AP continua ativo por AP_GRACE_MS para a página mostrar o novo IP
+        if self.ap and self.ap.active():
+            self.ap_off_at = time.ticks_add(time.ticks_ms(), AP_GRACE_MS)
+        self._set_state(CONNECTED)
 
     def try_connect_saved(self):
         """Tenta conectar usando configuração salva"""
-        config = self.load_config()
+        config = self.config
         if config:
             print("\nConfiguração WiFi encontrada, tentando conectar...")
-            return self.connect_wifi(config['ssid'], config['password'])
+            return self.connect_wifi(config['ssid'], config['password'], retry=True)
         print("\nNenhuma configuração WiFi encontrada")
         return False
 
-    def save_config(self, ssid, password, ip=None):
-        """Salva configuração WiFi"""
+    def save_config(self, ssid, password, last_ip=None, bssid=None, channel=None, ip_config=None):
+        """Salva configuração WiFi e dados da última conexão"""
         try:
             config = {
                 'ssid': ssid, 
                 'password': password,
-                'last_ip': ip
+                'last_ip': last_ip,
+                'bssid': bssid,
+                'channel': channel,
+                'ip_config': ip_config
             }
             with open(self.config_file, 'w') as f:
                 json.dump(config, f)
+            self.config = config
             print("Configuração WiFi salva")
         except:
             print("Erro ao salvar configuração WiFi")
@@ -117,24 +259,131 @@ class WiFiManager:
             return None
 
     def scan_networks(self):
-        """Busca redes WiFi disponíveis"""
+        """Redes encontradas na última busca (nunca bloqueia)
+        
+        Com o resultado mais velho que SCAN_TTL_MS, inicia uma nova busca
+        em segundo plano e devolve o resultado anterior.
+        """
+        age = time.ticks_diff(time.ticks_ms(), self.scan_time) if self.scan_time is not None else None
+        if age is None or age > SCAN_TTL_MS:
+            self.start_scan()
+        return {
+            'networks': self.networks,
+            'scanning': self.scanning,
+            'age_ms': age
+        }
+
+    def start_scan(self):
+        """Inicia a busca de redes em uma _thread"""
+        if self.scanning:
+            return
         if not self.station:
             self.station = network.WLAN(network.STA_IF)
-        
         self.station.active(True)
+        self.scanning = True
+        if _thread:
+            # scan() libera o GIL: o servidor e a captura seguem rodando
+            _thread.start_new_thread(self._scan, ())
+        else:
+            self._scan()
+
+    def _scan(self):
         print("\nBuscando redes WiFi...")
         try:
-            networks = self.station.scan()
-            return [net[0].decode() for net in networks]
+            found = {}
+            for ssid, bssid, channel, rssi, authmode, hidden in self.station.scan():
+                ssid = ssid.decode()
+                if not ssid or (ssid in found and found[ssid]['rssi'] >= rssi):
+                    continue
+                found[ssid] = {
+                    'ssid': ssid,
+                    'bssid': ':'.join('%02x' % b for b in bssid),
+                    'channel': channel,
+                    'rssi': rssi,
+                    'auth': AUTH_MODES[authmode] if authmode < len(AUTH_MODES) else str(authmode)
+                }
+            self.networks = sorted(found.values(), key=lambda net: -net['rssi'])
         except:
             print("Erro ao buscar redes")
-            return []
+        self.scan_time = time.ticks_ms()
+        self.scanning = False
 
-    def get_status(self):
-        """Retorna status das conexões"""
-        return {
+    def supervise(self):
+        """Avança a máquina de estados da conexão (chamado periodicamente)
+        
+        Mantém o dispositivo acessível: reativa o AP se a conexão falhar
+        ou cair e desliga o AP AP_GRACE_MS após conectar.
+        """
+        now = time.ticks_ms()
+        connected = self.station.isconnected() if self.station else False
+        
+        if self.state == CONNECTING:
+            if connected:
+                self._on_connected()
+            else:
+                code = self.station.status()
+                timeout = FAST_CONNECT_TIMEOUT_MS if self.fast else CONNECT_TIMEOUT_MS
+                if code in FAIL_STATUS or time.ticks_diff(now, self.state_since) > timeout:
+                    self.station.disconnect()
+                    if self.fast:
+                        # BSSID/canal/IP salvos não serviram: conexão completa
+                        print('\nConexão rápida falhou, tentando conexão completa...')
+                        self.fast = False
+                        self._start_connect()
+                    else:
+                        print('\nFalha na conexão')
+                        self._fail(f'status {code}')
+        
+        elif self.state == CONNECTED:
+            if not connected:
+                # Watchdog: reconecta na hora pelo caminho rápido
+                print("\nConexão WiFi perdida, reconectando...")
+                self.reconnects += 1
+                self.attempt_since = now
+                self.fast = self._saved_link() is not None
+                self._start_connect()
+            elif self.ap_off_at is not None and time.ticks_diff(now, self.ap_off_at) >= 0:
+                self.ap_off_at = None
+                if self.ap and self.ap.active():
+                    print("Desativando AP...")
+                    self.ap.active(False)
+                self.refresh_status()
+        
+        elif self.state == FAILED and self.retry and time.ticks_diff(now, self.retry_at) >= 0:
+            if self._ap_clients():
+                # Alguém na página de configuração: a tentativa mudaria o
+                # canal do rádio e derrubaria o AP
+                self.retry_at = time.ticks_add(now, RETRY_MIN_MS)
+            else:
+                self.attempt_since = now
+                self.fast = self._saved_link() is not None
+                self._start_connect()
+        
+        if self.state in (IDLE, FAILED) and not (self.ap and self.ap.active()):
+            print("\nSem conexão WiFi, reativando Access Point...")
+            self.start_ap()
+        return connected
+
+    def refresh_status(self):
+        """Relê o estado das interfaces (chamado nos eventos de conexão)"""
+        self.status = {
             'ap_active': self.ap.active() if self.ap else False,
             'ap_ip': self.ap.ifconfig()[0] if self.ap and self.ap.active() else None,
             'sta_connected': self.station.isconnected() if self.station else False,
-            'sta_ip': self.station.ifconfig()[0] if self.station and self.station.isconnected() else None
-        } 
\ No newline at end of file
+            'sta_ip': self.station.ifconfig()[0] if self.station and self.station.isconnected() else None,
+            'state': self.state,
+            'ssid': self.ssid,
+            'error': self.error,
+            'fast_connect': self.fast,
+            'reconnects': self.reconnects,
+            'last_connect_ms': self.last_connect_ms
+        }
+        return self.status
+
+    def get_status(self):
+        """Retorna status das conexões (cópia do cache)"""
+        if self.status is None:
+            self.refresh_status()
+        status = dict(self.status)
+        status['state_ms'] = time.ticks_diff(time.ticks_ms(), self.state_since)
+        return status 
\ No newline at end of file
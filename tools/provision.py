@@ -0,0 +1,248 @@
+# Provisiona vários ESP32 em paralelo (montagem em lotes)
+#
+# Uso:
+#     python tools/provision.py [frota.json] [--workers N] [--firmware] [--tudo] [--py]
+#     python tools/provision.py [frota.json] --simulado N
+#
+# Todos os ESP32 conectados passam pelas etapas firmware -> configuração ->
+# arquivos, cada um em uma thread do pool (esptool e mpremote rodam como
+# subprocessos; as threads apenas aguardam). Os módulos são compilados e
+# as páginas comprimidas uma única vez, antes do pool. As opções --firmware,
+# --tudo e --py são as mesmas de upload_files.py.
+#
+# frota.json define valores do settings.json de cada dispositivo,
+# identificado pelo MAC ou pela porta:
+#
+#     {
+#         "default": {"can_bitrate": 250000},
+#         "devices": [
+#             {"mac": "a4cf12000001", "ap_ssid": "JD-Plantadeira-01", "can_bitrate": 500000},
+#             {"port": "COM7", "ap_ssid": "JD-Pulverizador-02", "filter_pgns": [61444, 65265]}
+#         ]
+#     }
+#
+# Dispositivos sem entrada recebem o AP "JohnDeere-AP-<final do MAC>".
+# --simulado N executa o mesmo fluxo com N dispositivos falsos (FakeBackend),
+# enviando os fontes .py sem compilar (não instala nem roda o mpy-cross).
+import sys
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import upload_files
+from upload_files import MPRemote, ensure_tool, file_hash, install_firmware, prepare_files, sync_files
+
+DEFAULT_WORKERS = 4
+STAGES = ("firmware", "config", "arquivos")
+
+
+class FakeBackend:
+    """ESP32 simulados com a mesma interface de upload_files.MPRemote
+
+    Cada operação espera um tempo proporcional ao trabalho real e conta as
+    sessões abertas ao mesmo tempo (max_parallel). failing associa uma
+    porta à operação que deve falhar ('flash', 'sync', ...).
+    """
+
+    def __init__(self, count, delay=0.05, failing=None):
+        self.devices = {}
+        for i in range(count):
+            self.devices[f"SIM{i}"] = {
+                'mac': f"a4cf12{i:06x}",
+                # Metade já com o firmware atual (gravação ignorada)
+                'version': upload_files.FIRMWARE_VERSION if i % 2 else None,
+                'settings': {},
+                'files': {}
+            }
+        self.delay = delay
+        self.failing = failing or {}
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_parallel = 0
+
+    def _session(self, port, operation, seconds):
+        if self.failing.get(port) == operation:
+            raise RuntimeError(f"falha simulada em {operation}")
+        with self.lock:
+            self.active += 1
+            self.max_parallel = max(self.max_parallel, self.active)
+        try:
+            time.sleep(seconds)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def ports(self):
+        return list(self.devices)
+
+    def firmware_version(self, port):
+        self._session(port, 'version', self.delay)
+        return self.devices[port]['version']
+
+    def flash(self, port, firmware_path):
+        self._session(port, 'flash', self.delay * 20)
+        device = self.devices[port]
+        device['version'] = upload_files.FIRMWARE_VERSION
+        device['settings'] = {}
+        device['files'] = {}
+
+    def device_id(self, port):
+        self._session(port, 'device_id', self.delay)
+        return self.devices[port]['mac']
+
+    def write_settings(self, port, values):
+        self._session(port, 'settings', self.delay)
+        settings = self.devices[port]['settings']
+        if all(settings.get(key) == value for key, value in values.items()):
+            return False
+        settings.update(values)
+        return True
+
+    def file_hashes(self, port, names):
+        self._session(port, 'hashes', self.delay)
+        files = self.devices[port]['files']
+        return {name: files[name] for name in names if name in files}
+
+    def sync(self, port, copies, removals):
+        self._session(port, 'sync', self.delay * (1 + len(copies)))
+        files = self.devices[port]['files']
+        for local_file, remote_file in copies:
+            files[remote_file[1:]] = file_hash(local_file)
+        for name in removals:
+            files.pop(name, None)
+
+
+def load_fleet(path):
+    """Lê frota.json (sem arquivo: apenas os valores automáticos)"""
+    if not path:
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def device_settings(fleet, port, mac):
+    """Valores do settings.json do dispositivo (padrão + entrada por MAC ou porta)"""
+    values = {'ap_ssid': f"JohnDeere-AP-{mac[-4:].upper()}"}
+    values.update(fleet.get('default', {}))
+    for entry in fleet.get('devices', []):
+        if entry.get('mac', '').lower().replace(':', '') == mac or entry.get('port') == port:
+            values.update({key: value for key, value in entry.items() if key not in ('mac', 'port')})
+    return values
+
+
+def provision_device(backend, port, build, fleet, force_flash=False, full=False):
+    """Executa as etapas em um ESP32; retorna tempos e o erro (se houver)"""
+    files, stale = build
+    result = {
+        'port': port,
+        'mac': None,
+        'ap_ssid': None,
+        'flashed': False,
+        'sent': 0,
+        'times': {},
+        'error': None
+    }
+
+    def log(message):
+        print(f"[{port}] {message.strip()}")
+
+    start = time.monotonic()
+    stage = STAGES[0]
+    try:
+        result['flashed'] = install_firmware(port, force_flash, backend, log)
+        result['times'][stage] = time.monotonic() - start
+
+        stage = STAGES[1]
+        stage_start = time.monotonic()
+        result['mac'] = backend.device_id(port)
+        settings = device_settings(fleet, port, result['mac'])
+        result['ap_ssid'] = settings.get('ap_ssid')
+        changed = backend.write_settings(port, settings)
+        log(f"settings.json {'atualizado' if changed else 'sem alterações'}: {settings}")
+        result['times'][stage] = time.monotonic() - stage_start
+
+        # Reinicia mesmo sem arquivos novos se a configuração mudou
+        stage = STAGES[2]
+        stage_start = time.monotonic()
+        result['sent'] = sync_files(port, files, stale, full, changed, backend, log)
+        result['times'][stage] = time.monotonic() - stage_start
+    except Exception as e:
+        result['error'] = f"{stage}: {e}"
+        log(f"Erro na etapa {stage}: {e}")
+    result['times']['total'] = time.monotonic() - start
+    return result
+
+
+def provision(backend, build, fleet, workers=DEFAULT_WORKERS, force_flash=False, full=False):
+    """Provisiona todos os ESP32 do backend em um pool de até workers threads"""
+    ports = backend.ports()
+    if not ports:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(ports))) as pool:
+        futures = [pool.submit(provision_device, backend, port, build, fleet, force_flash, full)
+                   for port in ports]
+        return [future.result() for future in futures]
+
+
+def print_summary(results, elapsed):
+    """Tabela com tempos por etapa e falhas de cada dispositivo"""
+    print(f"\n{'Porta':<14} | {'MAC':<12} | {'AP':<20} | {'Firmware':>15} | "
+          f"{'Config':>7} | {'Arquivos':>13} | {'Total':>7} | Resultado")
+    for r in results:
+        times = r['times']
+        firmware = f"{times['firmware']:.1f} s" if 'firmware' in times else '-'
+        if 'firmware' in times:
+            firmware += " (gravado)" if r['flashed'] else " (igual)"
+        config = f"{times['config']:.1f} s" if 'config' in times else '-'
+        sent = f"{times['arquivos']:.1f} s ({r['sent']})" if 'arquivos' in times else '-'
+        print(f"{r['port']:<14} | {r['mac'] or '-':<12} | {r['ap_ssid'] or '-':<20} | {firmware:>15} | "
+              f"{config:>7} | {sent:>13} | {times['total']:>5.1f} s | {r['error'] or 'ok'}")
+    failures = sum(1 for r in results if r['error'])
+    print(f"\n{len(results) - failures} de {len(results)} dispositivo(s) provisionado(s) em {elapsed:.1f} s")
+
+
+def option(args, name, default=None):
+    """Valor de '--nome valor' na linha de comando"""
+    if name in args:
+        index = args.index(name)
+        if index + 1 < len(args):
+            return args[index + 1]
+    return default
+
+
+def main():
+    args = sys.argv[1:]
+    workers = int(option(args, "--workers", DEFAULT_WORKERS))
+    simulated = option(args, "--simulado")
+    values = {option(args, name) for name in ("--workers", "--simulado")}
+    paths = [arg for arg in args if not arg.startswith("--") and arg not in values]
+    fleet = load_fleet(paths[0] if paths else None)
+
+    start = time.monotonic()
+    if simulated:
+        backend = FakeBackend(int(simulated))
+    else:
+        ensure_tool("esptool", "esptool")
+        ensure_tool("mpremote", "mpremote")
+        backend = MPRemote(quiet=True)
+
+    print("Preparando arquivos...")
+    # Simulado: sem mpy-cross (nada a instalar nem compilar), roda offline
+    build = prepare_files(compile_modules="--py" not in args and not simulated)
+
+    print("\nProcurando ESP32...")
+    results = provision(backend, build, fleet, workers,
+                        force_flash="--firmware" in args, full="--tudo" in args)
+    if not results:
+        print("Nenhum ESP32 encontrado!")
+        return
+    print_summary(results, time.monotonic() - start)
+    if simulated:
+        print(f"Sessões simultâneas (máximo): {backend.max_parallel}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,60 +2,209 @@ import sys
 import time
 import subprocess
 import os
+import re
+import gzip
+import json
+import hashlib
+import importlib.util
 from serial.tools import list_ports
 import serial
 
+# Uso: python tools/upload_files.py [--py] [--tudo] [--firmware]
+#   --py        envia os módulos como .py (sem compilar com mpy-cross)
+#   --tudo      envia todos os arquivos, mesmo os que não mudaram
+#   --firmware  grava o firmware mesmo se a versão do ESP32 já for a mesma
+#
+# Para vários ESP32 ao mesmo tempo, veja tools/provision.py.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRMWARE_PATH = f"{BASE_DIR}/esp32/firmware/ESP32_GENERIC-20241129-v1.24.1.bin"
+FIRMWARE_VERSION = re.search(r"v(\d+\.\d+\.\d+)", FIRMWARE_PATH).group(1)
+
+# Executados como .py pelo MicroPython (não podem ser .mpy)
+SCRIPTS = ["boot.py", "main.py"]
+
+# Módulos importados: compilados para .mpy (sem compilação no boot e menos RAM)
+MODULES = [
+    "compat.py",
+    "fastpath.py",
+    "can_handler.py",
+    "can_capture.py",
+    "frame_history.py",
+    "frame_stream.py",
+    "j1939_tp.py",
+    "pgn_table.py",
+    "flash_log.py",
+    "profiler.py",
+    "http_request.py",
+    "settings.py",
+    "wifi_manager.py",
+    "websocket.py",
+    "web_server.py"
+]
+
+# Conversores USB-serial comuns em placas ESP32
+USB_SERIAL_IDS = ["CP210", "CH340", "USB Serial"]
+
+# Executado no ESP32: cria www/ e devolve o SHA-256 dos arquivos existentes
+REMOTE_HASHES = """
+import os, json, hashlib, binascii
+try:
+    os.mkdir('www')
+except OSError:
+    pass
+hashes = {}
+for name in %s:
+    try:
+        h = hashlib.sha256()
+        with open(name, 'rb') as f:
+            while True:
+                chunk = f.read(1024)
+                if not chunk:
+                    break
+                h.update(chunk)
+        hashes[name] = binascii.hexlify(h.digest()).decode()
+    except OSError:
+        pass
+print(json.dumps(hashes))
+"""
+
+# Executado no ESP32: mescla os valores em settings.json; informa se mudou
+REMOTE_SETTINGS = """
+import json
+try:
+    with open('settings.json') as f:
+        settings = json.load(f)
+except:
+    settings = {}
+values = json.loads(%r)
+if all(settings.get(key) == value for key, value in values.items()):
+    print('igual')
+else:
+    settings.update(values)
+    with open('settings.json', 'w') as f:
+        json.dump(settings, f)
+    print('alterado')
+"""
+
+REMOTE_MAC = ("import network, binascii; "
+              "print(binascii.hexlify(network.WLAN(network.STA_IF).config('mac')).decode())")
+
+def find_esp32_ports():
+    """Portas seriais de todos os ESP32 conectados"""
+    return [port.device for port in list_ports.comports()
+            if any(id in port.description for id in USB_SERIAL_IDS)]
+
 def find_esp32_port():
     """Encontra a porta COM do ESP32"""
-    ports = list(list_ports.comports())
-    for port in ports:
-        # Adiciona mais identificadores comuns de ESP32
-        if any(id in port.description for id in ["CP210", "CH340", "USB Serial"]):
-            return port.device
-    return None
-
-def flash_micropython(port):
-    """Instala o MicroPython no ESP32"""
-    firmware_path = "D:/Documentos/CAN_BUS/teste-5/esp32/firmware/ESP32_GENERIC-20241129-v1.24.1.bin"
-    
-    if not os.path.exists(firmware_path):
-        print(f"Erro: Firmware não encontrado em {firmware_path}")
-        print("Verifique se o arquivo está na pasta correta.")
-        return False
-        
-    try:
-        # Instalar/atualizar esptool
-        print("\nVerificando esptool...")
-        subprocess.run([
-            sys.executable, "-m", "pip", "install", "--upgrade", "esptool"
-        ], check=True)
-        
-        # Apagar flash
-        print("\nApagando flash do ESP32...")
-        subprocess.run([
-            sys.executable, "-m", "esptool", 
-            "--port", port, 
-            "--baud", "460800",  # Aumenta velocidade do erase
-            "erase_flash"
-        ], check=True)
+    ports = find_esp32_ports()
+    return ports[0] if ports else None
+
+def ensure_tool(module, package):
+    """Instala a ferramenta via pip apenas se ainda não estiver instalada"""
+    if importlib.util.find_spec(module) is None:
+        print(f"\nInstalando {package}...")
+        subprocess.run([sys.executable, "-m", "pip", "install", package], check=True)
+
+def ensure_mpy_cross():
+    """mpy-cross da mesma versão do firmware (formato .mpy compatível)"""
+    package = f"mpy-cross=={FIRMWARE_VERSION}.*"
+    ensure_tool("mpy_cross", package)
+    result = subprocess.run([sys.executable, "-m", "mpy_cross", "--version"],
+                            capture_output=True, text=True)
+    if f"v{FIRMWARE_VERSION}" not in result.stdout:
+        print(f"\nAtualizando mpy-cross para {FIRMWARE_VERSION}...")
+        subprocess.run([sys.executable, "-m", "pip", "install", package], check=True)
+
+class MPRemote:
+    """Acesso ao ESP32 por esptool e mpremote (um subprocesso por sessão)
+
+    provision.FakeBackend implementa a mesma interface sem hardware.
+    """
+
+    def __init__(self, quiet=False):
+        self.quiet = quiet  # Esconde a saída do esptool (vários ESP32 em paralelo)
+
+    def ports(self):
+        return find_esp32_ports()
+
+    def session(self, port, *args, timeout=None):
+        """Executa uma sessão do mpremote (comandos encadeados com '+')"""
+        result = subprocess.run([sys.executable, "-m", "mpremote", "connect", port, *args],
+                                check=True, capture_output=True, text=True, timeout=timeout)
+        return result.stdout
+
+    def exec(self, port, code, timeout=60):
+        """Executa código no ESP32; retorna a última linha impressa"""
+        lines = self.session(port, "exec", code, timeout=timeout).strip().splitlines()
+        return lines[-1] if lines else ""
+
+    def firmware_version(self, port):
+        """Versão do MicroPython no ESP32 ou None se não responder"""
+        try:
+            return self.exec(port, "import os; print(os.uname().release)", timeout=15) or None
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            return None
+
+    def flash(self, port, firmware_path):
+        """Apaga a flash e grava o firmware"""
+        ensure_tool("esptool", "esptool")
+        esptool = [sys.executable, "-m", "esptool", "--port", port, "--baud", "460800"]
+        subprocess.run(esptool + ["erase_flash"], check=True, capture_output=self.quiet)
         time.sleep(2)
-        
-        # Instalar firmware
-        print("\nInstalando MicroPython...")
-        subprocess.run([
-            sys.executable, "-m", "esptool",
-            "--port", port,
-            "--baud", "460800",
-            "write_flash",
-            "--flash_size=detect", "0x1000",
-            firmware_path
-        ], check=True)
-        
-        print("\nMicroPython instalado com sucesso!")
-        print("Aguardando reinicialização do ESP32...")
-        time.sleep(3)
+        subprocess.run(esptool + ["write_flash", "--flash_size=detect", "0x1000", firmware_path],
+                       check=True, capture_output=self.quiet)
+        time.sleep(3)  # Aguarda a reinicialização do ESP32
+
+    def device_id(self, port):
+        """MAC da interface WiFi (identifica o ESP32 independente da porta)"""
+        return self.exec(port, REMOTE_MAC)
+
+    def write_settings(self, port, values):
+        """Mescla values no settings.json do ESP32; retorna True se mudou"""
+        return self.exec(port, REMOTE_SETTINGS % json.dumps(values)) == "alterado"
+
+    def file_hashes(self, port, names):
+        """SHA-256 dos arquivos que já existem no ESP32 (cria www/)"""
+        return json.loads(self.exec(port, REMOTE_HASHES % json.dumps(names)))
+
+    def sync(self, port, copies, removals):
+        """Copia e remove arquivos e reinicia o ESP32 em uma única sessão"""
+        commands = []
+        for local_file, remote_file in copies:
+            commands += ["fs", "cp", local_file, remote_file, "+"]
+        for name in removals:
+            commands += ["fs", "rm", f":{name}", "+"]
+        self.session(port, *commands, "reset")
+
+def install_firmware(port, force=False, backend=None, log=print):
+    """Grava o MicroPython se a versão do ESP32 for diferente (ou force)
+
+    Retorna True se gravou e False se a versão já era a mesma.
+    """
+    backend = backend or MPRemote()
+    if not force:
+        version = backend.firmware_version(port)
+        if version == FIRMWARE_VERSION:
+            log(f"MicroPython {version} já instalado, gravação do firmware ignorada")
+            return False
+        log(f"Versão no ESP32: {version or 'nenhuma'}; instalando {FIRMWARE_VERSION}")
+    if not os.path.exists(FIRMWARE_PATH):
+        raise FileNotFoundError(f"Firmware não encontrado em {FIRMWARE_PATH}")
+    log("Apagando flash e instalando MicroPython...")
+    backend.flash(port, FIRMWARE_PATH)
+    log("MicroPython instalado com sucesso!")
+    return True
+
+def flash_micropython(port, force=False):
+    """Instala o MicroPython no ESP32 (se a versão for diferente ou force)"""
+    try:
+        install_firmware(port, force)
         return True
-        
+    except FileNotFoundError as e:
+        print(f"Erro: {e}")
+        print("Verifique se o arquivo está na pasta correta.")
+        return False
     except subprocess.CalledProcessError as e:
         print(f"\nErro durante instalação do MicroPython: {e}")
         return False
@@ -63,55 +212,122 @@ def flash_micropython(port):
         print(f"\nErro inesperado: {e}")
         return False
 
-def transfer_files(port):
-    """Transfere os arquivos Python para o ESP32"""
+def build_assets(base_dir):
+    """Comprime as páginas de esp32/www em build/www (.gz)
+
+    O gzip é gerado com mtime=0 para que o mesmo HTML produza o mesmo
+    arquivo (e o mesmo ETag no ESP32).
+    """
+    source_dir = f"{base_dir}/esp32/www"
+    build_dir = f"{base_dir}/build/www"
+    os.makedirs(build_dir, exist_ok=True)
+    assets = []
+    for name in sorted(os.listdir(source_dir)):
+        if not name.endswith(('.html', '.js', '.css')):
+            continue
+        with open(os.path.join(source_dir, name), 'rb') as f:
+            data = f.read()
+        target = f"{build_dir}/{name}.gz"
+        with open(target, 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        print(f"{name}: {len(data)} -> {os.path.getsize(target)} bytes")
+        assets.append((target, f":www/{name}.gz"))
+    return assets
+
+def build_modules(compile_modules=True):
+    """Prepara os módulos em build/device
+
+    Com compile_modules, cada módulo é compilado para .mpy (apenas se o
+    .py for mais novo); -march=xtensawin gera o código nativo das funções
+    viper/native. Retorna a lista (arquivo local, destino no ESP32).
+    """
+    source_dir = f"{BASE_DIR}/esp32"
+    build_dir = f"{BASE_DIR}/build/device"
+    os.makedirs(build_dir, exist_ok=True)
+    files = [(f"{source_dir}/{name}", f":{name}") for name in SCRIPTS]
+    for name in MODULES:
+        source = f"{source_dir}/{name}"
+        if not compile_modules:
+            files.append((source, f":{name}"))
+            continue
+        target = f"{build_dir}/{name[:-3]}.mpy"
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source):
+            print(f"Compilando {name}...")
+            subprocess.run([
+                sys.executable, "-m", "mpy_cross",
+                "-march=xtensawin",
+                "-o", target,
+                source
+            ], check=True)
+        files.append((target, f":{name[:-3]}.mpy"))
+    return files
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def prepare_files(compile_modules=True):
+    """Compila os módulos e comprime as páginas (uma vez para todos os ESP32)
+
+    Retorna (arquivos, sobras): a lista (arquivo local, destino no ESP32)
+    e os nomes da versão .py/.mpy do outro modo, a remover se existirem
+    (.py tem prioridade no import e esconderia o .mpy novo).
+    """
+    if compile_modules:
+        ensure_mpy_cross()
+    
+    # Verificar se todos os arquivos existem
+    source_dir = f"{BASE_DIR}/esp32"
+    missing_files = [name for name in SCRIPTS + MODULES
+                     if not os.path.exists(f"{source_dir}/{name}")]
+    if missing_files:
+        raise FileNotFoundError(f"Arquivos não encontrados em {source_dir}/: {', '.join(missing_files)}")
+    
+    files = build_modules(compile_modules)
+    
+    # Páginas web comprimidas (servidas com Content-Encoding: gzip)
+    print("\nComprimindo páginas web...")
+    files += build_assets(BASE_DIR)
+    
+    stale = [name if compile_modules else f"{name[:-3]}.mpy" for name in MODULES]
+    return files, stale
+
+def sync_files(port, files, stale, full=False, reset=False, backend=None, log=print):
+    """Envia apenas os arquivos alterados, em uma única sessão
+
+    Com reset, reinicia o ESP32 mesmo sem arquivos alterados (por exemplo
+    após mudar o settings.json). Retorna o número de arquivos enviados.
+    """
+    backend = backend or MPRemote()
+    log("Comparando com os arquivos do ESP32...")
+    remote = backend.file_hashes(port, [dest[1:] for _, dest in files] + stale)
+    changed = [(local, dest) for local, dest in files
+               if full or remote.get(dest[1:]) != file_hash(local)]
+    stale = [name for name in stale if name in remote]
+    
+    if not changed and not stale and not reset:
+        log("Nenhum arquivo alterado")
+        return 0
+    
+    for local_file, remote_file in changed:
+        log(f"Enviando {os.path.basename(local_file)}...")
+    for name in stale:
+        log(f"Removendo {name}...")
+    backend.sync(port, changed, stale)
+    return len(changed)
+
+def transfer_files(port, compile_modules=True, full=False):
+    """Envia ao ESP32 apenas os arquivos alterados, em uma única sessão"""
     try:
-        # Instalar/atualizar mpremote
-        print("\nVerificando mpremote...")
-        subprocess.run([
-            sys.executable, "-m", "pip", "install", "--upgrade", "mpremote"
-        ], check=True)
-        
-        # Lista de arquivos para transferir
-        base_dir = "D:/Documentos/CAN_BUS/teste-5"
-        files = [
-            (f"{base_dir}/esp32/boot.py", ":boot.py"),
-            (f"{base_dir}/esp32/main.py", ":main.py"),
-            (f"{base_dir}/esp32/can_handler.py", ":can_handler.py"),
-            (f"{base_dir}/esp32/wifi_manager.py", ":wifi_manager.py"),
-            (f"{base_dir}/esp32/web_server.py", ":web_server.py")
-        ]
-        
-        # Verificar se todos os arquivos existem
-        missing_files = [f for f, _ in files if not os.path.exists(f)]
-        if missing_files:
-            print("\nArquivos não encontrados:")
-            for f in missing_files:
-                print(f"- {f}")
-            print("\nVerifique se os arquivos estão na pasta correta:")
-            print(f"{base_dir}/esp32/")
-            return False
-        
-        # Transferir arquivos
-        print("\nTransferindo arquivos...")
-        for local_file, remote_file in files:
-            print(f"Enviando {os.path.basename(local_file)}...")
-            try:
-                subprocess.run([
-                    sys.executable, "-m", "mpremote",
-                    f"connect", port,
-                    "cp",
-                    local_file,
-                    remote_file
-                ], check=True)
-                time.sleep(1)
-            except subprocess.CalledProcessError as e:
-                print(f"Erro ao enviar {local_file}: {e}")
-                return False
-            
-        print("\nTodos os arquivos transferidos com sucesso!")
+        ensure_tool("mpremote", "mpremote")
+        files, stale = prepare_files(compile_modules)
+        count = sync_files(port, files, stale, full)
+        print(f"\n{count} arquivo(s) transferido(s) com sucesso!")
         return True
         
+    except FileNotFoundError as e:
+        print(f"\n{e}")
+        return False
     except subprocess.CalledProcessError as e:
         print(f"\nErro durante transferência de arquivos: {e}")
         return False
@@ -142,7 +358,12 @@ def monitor_serial(port):
         print(f"\nErro durante monitoramento: {e}")
 
 def main():
+    compile_modules = "--py" not in sys.argv
+    full = "--tudo" in sys.argv
+    force_flash = "--firmware" in sys.argv
     try:
+        start = time.monotonic()
+        
         # 1. Encontrar porta do ESP32
         print("Procurando ESP32...")
         port = find_esp32_port()
@@ -156,19 +377,19 @@ def main():
         
         # 2. Instalar MicroPython
         print("\nIniciando instalação do MicroPython...")
-        if not flash_micropython(port):
+        if not flash_micropython(port, force_flash):
             print("Erro durante instalação do MicroPython")
             return
             
         # 3. Transferir arquivos
         print("\nIniciando transferência dos arquivos...")
-        if not transfer_files(port):
+        if not transfer_files(port, compile_modules, full):
             print("Erro durante transferência dos arquivos")
             return
         
-        print("\nProcesso concluído com sucesso!")
+        print(f"\nProcesso concluído com sucesso em {time.monotonic() - start:.1f} s!")
         print("O ESP32 irá reiniciar automaticamente.")
-        print("Procure pelo ponto de acesso 'JohnDeere_Monitor' em alguns segundos.")
+        print("Procure pelo ponto de acesso 'JohnDeere-AP' (ou o ap_ssid do settings.json) em alguns segundos.")
         
         # 4. Monitorar saída serial
         monitor_serial(port)
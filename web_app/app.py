@@ -42,6 +42,13 @@ def init_session_state():
         st.session_state.auto_update = False
     if 'running' not in st.session_state:
         st.session_state.running = True
+    if 'next_seq' not in st.session_state:
+        st.session_state.next_seq = None
+    if 'lost_frames' not in st.session_state:
+        st.session_state.lost_frames = 0
+    if 'http' not in st.session_state:
+        # Sessão com keep-alive: reaproveita a conexão TCP com o ESP32
+        st.session_state.http = requests.Session()
 
 def connect_to_esp32(ip):
     try:
@@ -56,7 +63,7 @@ def connect_to_esp32(ip):
         url = f"http://{ip}/status"
         st.info(f"Tentando conectar em: {url}")
         
-        response = requests.get(url, timeout=5)
+        response = st.session_state.http.get(url, timeout=5)
         if response.status_code == 200:
             st.success(f"Conectado ao ESP32 no IP: {ip}")
             st.session_state.connected = True
@@ -70,19 +77,52 @@ def connect_to_esp32(ip):
         st.session_state.connected = False
     return False
 
+def send_pgn_filters(ip, pgns):
+    """Configura os filtros de PGN do ESP32 (lista vazia = todo o barramento)
+
+    Os filtros valem para todo o dispositivo (log na flash, streaming e
+    outros clientes) até o próximo boot.
+    """
+    try:
+        response = st.session_state.http.post(
+            f"http://{ip}/filters",
+            data=json.dumps({"pgns": pgns}),
+            timeout=5
+        )
+        result = response.json()
+        if result.get("status") == "success":
+            if not pgns:
+                st.info("Filtros removidos: o ESP32 recebe todo o barramento")
+            else:
+                origem = "hardware" if result.get("hardware_exact") else "hardware + software"
+                st.info(f"Filtros de PGN configurados no ESP32 ({origem})")
+    except Exception as e:
+        st.warning(f"Não foi possível configurar filtros: {str(e)}")
+
 def fetch_can_data():
     if not st.session_state.connected or not st.session_state.esp32_ip:
         return None
         
     try:
+        # Pede apenas quadros novos desde a última sequência recebida
+        params = {"max": 200}
+        if st.session_state.next_seq is not None:
+            params["since"] = st.session_state.next_seq
         url = f"http://{st.session_state.esp32_ip}/data"
-        response = requests.get(url, timeout=2)
+        response = st.session_state.http.get(url, params=params, timeout=2)
         if response.status_code == 200:
             data = response.json()
-            if data.get("current"):
-                st.session_state.can_data.append(data["current"])
-                if len(st.session_state.can_data) > 100:
-                    st.session_state.can_data.pop(0)
+            st.session_state.next_seq = data["next"]
+            st.session_state.lost_frames += data.get("lost", 0)
+            frames = data["frames"]
+            decoded_frames = J1939Decoder.decode_many((frame["pgn"], frame["data"]) for frame in frames)
+            for frame, decoded in zip(frames, decoded_frames):
+                if decoded:
+                    frame['decoded'] = decoded
+                st.session_state.can_data.append(frame)
+            if len(st.session_state.can_data) > 500:
+                del st.session_state.can_data[:-500]
+            data["current"] = st.session_state.can_data[-1] if st.session_state.can_data else None
             return data
     except requests.exceptions.ConnectionError:
         st.warning("Conexão perdida com ESP32")
@@ -91,6 +131,21 @@ def fetch_can_data():
         st.warning(f"Erro ao obter dados: {str(e)}")
     return None
 
+def fetch_snapshot():
+    """Último valor de cada (PGN, origem) visto pelo ESP32"""
+    try:
+        url = f"http://{st.session_state.esp32_ip}/snapshot"
+        response = st.session_state.http.get(url, timeout=2)
+        if response.status_code == 200:
+            entries = response.json()["entries"]
+            decoded_entries = J1939Decoder.decode_many((entry["pgn"], entry["data"]) for entry in entries)
+            for entry, decoded in zip(entries, decoded_entries):
+                entry["nome"] = decoded["name"] if decoded else ""
+            return entries
+    except Exception as e:
+        st.warning(f"Erro ao obter últimos valores: {str(e)}")
+    return None
+
 def create_gauge(value, title, unit, min_val, max_val):
     """Cria gauge com estilo John Deere"""
     return go.Figure(go.Indicator(
@@ -117,9 +172,9 @@ def create_gauge(value, title, unit, min_val, max_val):
 
 def create_time_series(data_history, param_name, unit):
     """Cria gráfico de série temporal"""
-    times = [d['timestamp'] for d in data_history]
-    values = [d['decoded']['values'][param_name]['value'] 
-             for d in data_history if param_name in d.get('decoded', {}).get('values', {})]
+    points = [d for d in data_history if param_name in d.get('decoded', {}).get('values', {})]
+    times = [d['timestamp'] for d in points]
+    values = [d['decoded']['values'][param_name]['value'] for d in points]
     
     return go.Figure(data=go.Scatter(
         x=times,
@@ -169,12 +224,24 @@ def main():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Conectar"):
+                st.session_state.next_seq = None
                 connect_to_esp32(ip_input)
         with col2:
             st.session_state.auto_update = st.checkbox(
                 "Auto Atualizar", 
                 value=st.session_state.auto_update
             )
+        
+        # Filtros afetam o dispositivo inteiro: só sob pedido explícito
+        if st.session_state.connected:
+            st.caption("Filtros de PGN valem para todo o ESP32 (log e streaming) até reiniciar")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("Filtrar decodificados"):
+                    send_pgn_filters(st.session_state.esp32_ip, J1939Decoder.pgns())
+            with col2:
+                if st.button("Remover filtros"):
+                    send_pgn_filters(st.session_state.esp32_ip, [])
     
     # Layout principal
     if st.session_state.running:
@@ -223,6 +290,7 @@ def main():
                         st.metric("PGN", current["pgn"])
                         st.metric("Origem", f"0x{current['source']:02X}")
                         st.metric("Prioridade", current["priority"])
+                        st.metric("Quadros perdidos", st.session_state.lost_frames)
                         st.text("Dados Hexadecimais:")
                         hex_data = " ".join([f"{x:02X}" for x in current["data"]])
                         st.code(hex_data)
@@ -230,6 +298,14 @@ def main():
                 st.info("Aguardando conexão com ESP32...")
             
         with col2:
+            if st.session_state.connected:
+                snapshot = fetch_snapshot()
+                if snapshot:
+                    st.subheader("Últimos Valores por PGN")
+                    st.dataframe(pd.DataFrame(snapshot)[[
+                        "pgn", "nome", "source", "data", "count", "period_ms"
+                    ]])
+            
             st.subheader("Histórico")
             if st.session_state.can_data:
                 df = pd.DataFrame(st.session_state.can_data)
@@ -0,0 +1,78 @@
+import os
+import struct
+import sys
+import requests
+from can_stream import parse_records
+
+# Formato dos segmentos de log do ESP32 (esp32/flash_log.py)
+SEGMENT_MAGIC = b'JL'
+SEGMENT_HEADER = struct.Struct('<2sBBI')  # magic, versão, reservado, boot
+
+
+def read_segment(data, decode=True):
+    """Decodifica um segmento; retorna (boot, registros)"""
+    magic, version, _, boot = SEGMENT_HEADER.unpack_from(data, 0)
+    if magic != SEGMENT_MAGIC or version != 1:
+        raise ValueError("Segmento de log inválido")
+    # Registro truncado no fim (falta de energia) é descartado por parse_records
+    return boot, parse_records(data[SEGMENT_HEADER.size:], decode)
+
+
+def read_segment_file(path, decode=True):
+    with open(path, 'rb') as f:
+        return read_segment(f.read(), decode)
+
+
+def list_segments(ip, timeout=5):
+    """Índice de segmentos gravados na flash do ESP32"""
+    response = requests.get(f"http://{ip}/log", timeout=timeout)
+    response.raise_for_status()
+    return response.json()["segments"]
+
+
+def download_segments(ip, directory, timeout=30):
+    """Baixa os segmentos ainda não salvos em directory
+
+    O segmento em gravação é sempre baixado de novo, pois continua
+    crescendo. Retorna a lista de arquivos baixados.
+    """
+    os.makedirs(directory, exist_ok=True)
+    segments = list_segments(ip)
+    downloaded = []
+    for i, segment in enumerate(segments):
+        path = os.path.join(directory, f"boot{segment['boot']:04d}_{segment['name']}")
+        is_current = i == len(segments) - 1
+        if os.path.exists(path) and not is_current:
+            continue
+        with requests.get(f"http://{ip}/log/{segment['name']}", stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            with open(path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=4096):
+                    f.write(chunk)
+        downloaded.append(path)
+    return downloaded
+
+
+def main():
+    """Baixa os logs do ESP32 ou mostra o conteúdo de segmentos locais"""
+    if len(sys.argv) < 3 or sys.argv[1] not in ('baixar', 'ler'):
+        print("Uso: python can_log.py baixar <IP do ESP32> [diretório]")
+        print("     python can_log.py ler <segmento.bin> [...]")
+        return
+
+    if sys.argv[1] == 'baixar':
+        directory = sys.argv[3] if len(sys.argv) > 3 else 'can_logs'
+        for path in download_segments(sys.argv[2], directory):
+            print(f"Baixado: {path}")
+        return
+
+    for path in sys.argv[2:]:
+        boot, records = read_segment_file(path, decode=False)
+        print(f"{path}: boot {boot}, {len(records)} quadros")
+        for record in records:
+            data = " ".join(f"{x:02X}" for x in record['data'])
+            print(f"  {record['seq']:>8} {record['timestamp']:>10} {record['id']} {record['pgn']} {data}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import socket
+import struct
+import sys
+import time
+from j1939_decoder import J1939Decoder
+
+# Formato do streaming binário do ESP32 (esp32/frame_stream.py)
+STREAM_PORT = 8081
+MAGIC = b'JD'
+HEADER = struct.Struct('<2sHI')   # magic, tamanho do payload, quadros perdidos
+RECORD = struct.Struct('<IIIH')   # seq, timestamp, ID, tamanho dos dados
+
+
+def j1939_pgn(can_id):
+    """Extrai o PGN do ID de 29 bits (PS zerado em PDU1)"""
+    pgn = (can_id >> 8) & 0x3FFFF
+    if (pgn >> 8) & 0xFF < 240:
+        pgn &= 0x3FF00
+    return pgn
+
+
+def parse_records(payload, decode=True):
+    """Converte o payload de um lote em lista de registros"""
+    records = []
+    offset = 0
+    size = len(payload)
+    while offset + RECORD.size <= size:
+        seq, timestamp, can_id, length = RECORD.unpack_from(payload, offset)
+        offset += RECORD.size
+        if offset + length > size:  # Registro truncado
+            break
+        raw = payload[offset:offset + length]
+        offset += length
+
+        pgn = j1939_pgn(can_id)
+        record = {
+            'seq': seq,
+            'timestamp': timestamp,
+            'id': f"0x{can_id:08X}",
+            'pgn': f"0x{pgn:04X}",
+            'data': list(raw),
+            'source': can_id & 0xFF,
+            'priority': (can_id >> 26) & 0x7
+        }
+        if decode:
+            decoded = J1939Decoder.decode_message(pgn, raw)
+            if decoded:
+                record['decoded'] = decoded
+        records.append(record)
+    return records
+
+
+class CANStreamClient:
+    """Cliente do streaming binário de quadros CAN do ESP32"""
+
+    def __init__(self, host, port=STREAM_PORT, timeout=5.0, decode=True):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.decode = decode
+        self.sock = None
+        self.lost = 0  # Quadros sobrescritos no ESP32 antes do envio
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        return self
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _read_exact(self, size):
+        buf = bytearray(size)
+        view = memoryview(buf)
+        received = 0
+        while received < size:
+            n = self.sock.recv_into(view[received:])
+            if not n:
+                raise ConnectionError("Conexão encerrada pelo ESP32")
+            received += n
+        return buf
+
+    def read_batch(self):
+        """Lê um lote; retorna (registros, quadros perdidos)"""
+        magic, length, lost = HEADER.unpack(self._read_exact(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("Cabeçalho de lote inválido")
+        payload = self._read_exact(length) if length else b''
+        self.lost += lost
+        return parse_records(payload, self.decode), lost
+
+    def __iter__(self):
+        while True:
+            records, _ = self.read_batch()
+            yield from records
+
+
+def main():
+    """Captura o streaming e mostra a taxa de quadros"""
+    if len(sys.argv) < 2:
+        print("Uso: python can_stream.py <IP do ESP32> [porta]")
+        return
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else STREAM_PORT
+
+    with CANStreamClient(sys.argv[1], port, timeout=None, decode=False) as client:
+        count = 0
+        start = time.monotonic()
+        for record in client:
+            count += 1
+            elapsed = time.monotonic() - start
+            if elapsed >= 1.0:
+                print(f"{count / elapsed:.0f} quadros/s | perdidos: {client.lost} | "
+                      f"último PGN {record['pgn']} seq {record['seq']}")
+                count = 0
+                start = time.monotonic()
+
+
+if __name__ == "__main__":
+    main()
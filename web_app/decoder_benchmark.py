@@ -0,0 +1,104 @@
+# Compara a decodificação J1939 original (byte a byte, PGN em texto) com os
+# extratores compilados do J1939Decoder
+#
+# Uso:
+#     python web_app/decoder_benchmark.py [quadros]
+#
+# Gera quadros sintéticos (PGNs conhecidos, desconhecidos e mensagens
+# curtas), confere que as duas versões dão o mesmo resultado e informa
+# quadros/s de cada uma.
+import gc
+import random
+import sys
+import time
+from j1939_decoder import J1939Decoder
+
+DEFAULT_FRAMES = 300000
+UNKNOWN_PGNS = (0xFECA, 0xFEF2, 0xEA00)
+
+
+def legacy_decode(pgn_hex, data):
+    """decode_message antes dos extratores (referência)"""
+    pgn = int(pgn_hex, 16)
+    if pgn not in J1939Decoder.PGN_DICT:
+        return None
+
+    pgn_info = J1939Decoder.PGN_DICT[pgn]
+    decoded = {'name': pgn_info['name'], 'values': {}}
+
+    for param_name, param_info in pgn_info['params'].items():
+        start = param_info['start_byte']
+        length = param_info['length']
+        resolution = param_info['resolution']
+
+        if start + length > len(data):
+            continue
+
+        value = 0
+        for i in range(length):
+            value |= data[start + i] << (8 * i)
+
+        final_value = value * resolution
+        if 'offset' in param_info:
+            final_value += param_info['offset']
+
+        decoded['values'][param_name] = {
+            'value': round(final_value, 2),
+            'unit': param_info['unit'],
+            'range': param_info['range']
+        }
+
+    return decoded
+
+
+def synthetic_frames(count, seed=1):
+    """(PGN inteiro, dados) com 80% de PGNs conhecidos e 5% de quadros curtos"""
+    rng = random.Random(seed)
+    known = J1939Decoder.pgns()
+    frames = []
+    for _ in range(count):
+        pgn = rng.choice(known) if rng.random() < 0.8 else rng.choice(UNKNOWN_PGNS)
+        size = rng.randint(1, 7) if rng.random() < 0.05 else 8
+        frames.append((pgn, bytes(rng.getrandbits(8) for _ in range(size))))
+    return frames
+
+
+def measure(label, function, count):
+    # Sem o GC: com centenas de milhares de dicts vivos, as coletas dominam a medida
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.enable()
+    print(f"{label:<42} {count / elapsed:>12,.0f} quadros/s")
+    return count / elapsed
+
+
+def run(count=DEFAULT_FRAMES):
+    frames = synthetic_frames(count)
+    # Como chegam do /data: PGN em texto e dados em lista
+    json_frames = [(f"0x{pgn:04X}", list(data)) for pgn, data in frames]
+
+    expected = [legacy_decode(pgn, data) for pgn, data in json_frames]
+    assert J1939Decoder.decode_many(frames) == expected
+    assert J1939Decoder.decode_many(json_frames) == expected
+
+    print(f"\n{count} quadros sintéticos")
+    before = measure("Original (texto, lista)",
+                     lambda: [legacy_decode(pgn, data) for pgn, data in json_frames], count)
+    measure("decode_message (texto, lista)",
+            lambda: [J1939Decoder.decode_message(pgn, data) for pgn, data in json_frames], count)
+    measure("decode_message (inteiro, bytes)",
+            lambda: [J1939Decoder.decode_message(pgn, data) for pgn, data in frames], count)
+    measure("decode_many (texto, lista)",
+            lambda: J1939Decoder.decode_many(json_frames), count)
+    after = measure("decode_many (inteiro, bytes)",
+                    lambda: J1939Decoder.decode_many(frames), count)
+    print(f"\nGanho: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FRAMES)
@@ -1,3 +1,8 @@
+import struct
+from fractions import Fraction
+import numpy as np
+
+
 class J1939Decoder:
     # Dicionário de PGNs John Deere
     PGN_DICT = {
@@ -28,34 +33,166 @@ class J1939Decoder:
     }
     
     @staticmethod
-    def decode_message(pgn_hex, data):
-        """Decodifica mensagem CAN com base no PGN"""
-        pgn = int(pgn_hex, 16)
-        if pgn not in J1939Decoder.PGN_DICT:
+    def pgns():
+        """Lista de PGNs decodificados (usada nos filtros do ESP32)"""
+        return sorted(J1939Decoder.PGN_DICT)
+    
+    @staticmethod
+    def decode_message(pgn, data):
+        """Decodifica mensagem CAN com base no PGN (inteiro ou texto hex)"""
+        if isinstance(pgn, str):
+            pgn = int(pgn, 16)
+        extractor = EXTRACTORS.get(pgn)
+        if extractor is None:
             return None
-            
-        pgn_info = J1939Decoder.PGN_DICT[pgn]
-        decoded = {'name': pgn_info['name'], 'values': {}}
+        return extractor.decode(data)
+    
+    @staticmethod
+    def decode_many(frames):
+        """Decodifica uma lista de (PGN, dados); None para PGNs desconhecidos"""
+        extractors = EXTRACTORS
+        results = []
+        for pgn, data in frames:
+            if isinstance(pgn, str):
+                pgn = int(pgn, 16)
+            extractor = extractors.get(pgn)
+            results.append(extractor.decode(data) if extractor is not None else None)
+        return results
+    
+    @staticmethod
+    def decode_columns(pgns, data, lengths=None):
+        """Decodifica quadros em lote em colunas NumPy (uma por sinal)
         
-        for param_name, param_info in pgn_info['params'].items():
-            start = param_info['start_byte']
-            length = param_info['length']
-            resolution = param_info['resolution']
-            
-            # Extrai valor dos bytes
-            value = 0
-            for i in range(length):
-                value |= data[start + i] << (8 * i)
-                
-            # Aplica resolução e offset
-            final_value = value * resolution
-            if 'offset' in param_info:
-                final_value += param_info['offset']
-                
-            decoded['values'][param_name] = {
-                'value': round(final_value, 2),
-                'unit': param_info['unit'],
-                'range': param_info['range']
-            }
-            
-        return decoded 
\ No newline at end of file
+        pgns: (N,) PGNs inteiros ou em texto; data: (N, 8) uint8; lengths: bytes
+        válidos de cada quadro (padrão: todos). Cada PGN conhecido é
+        decodificado em uma passada vetorizada. Retorna {sinal: float64
+        (N,)} com resolução e offset aplicados (sem arredondar); quadros de
+        outros PGNs, curtos demais ou com "erro"/"não disponível" do J1939
+        ficam NaN. Uso: pd.DataFrame(colunas, index=timestamps).
+        """
+        pgns = np.asarray(pgns)
+        if pgns.dtype.kind not in 'iu':
+            # PGNs em texto ('0xF004'), como em /data e decode_message
+            pgns = np.array([int(p, 16) if isinstance(p, (str, bytes)) else int(p)
+                             for p in pgns.tolist()], dtype=np.int64)
+        data = np.asarray(data, dtype=np.uint8)
+        if lengths is not None:
+            lengths = np.asarray(lengths)
+        columns = {}
+        for pgn, extractor in EXTRACTORS.items():
+            rows = np.flatnonzero(pgns == pgn)
+            block_lengths = lengths[rows] if lengths is not None else None
+            for param_name, values in extractor.decode_columns(data[rows], block_lengths):
+                # Sinal com o mesmo nome em outro PGN compartilha a coluna
+                column = columns.get(param_name)
+                if column is None:
+                    column = columns[param_name] = np.full(len(pgns), np.nan)
+                column[rows] = values
+        return columns
+
+
+# Tipos de escala dos parâmetros compilados (PGNExtractor)
+EXACT, CENTS, ROUND = range(3)
+
+
+class PGNExtractor:
+    """Decodificador de um PGN compilado a partir do PGN_DICT
+    
+    Parâmetros de 1, 2 e 4 bytes em ordem e sem sobreposição são lidos
+    por um único struct.Struct (bytes não usados viram padding); os
+    demais casos, e mensagens curtas demais para o struct, são lidos
+    parâmetro a parâmetro com int.from_bytes.
+    
+    A escala de cada parâmetro é resolvida na compilação, com o mesmo
+    resultado de round(valor * resolução + offset, 2):
+    - EXACT: resolução e offset inteiros (resultado inteiro, sem round)
+    - CENTS: múltiplos de 0,01; (valor * k + offset * 100) / 100
+    - ROUND: demais resoluções (ex.: 0,125), com round
+    """
+    FORMATS = {1: 'B', 2: 'H', 4: 'I'}
+    
+    def __init__(self, name, params):
+        self.name = name
+        # (nome, início, fim, tipo, escala, offset, unidade, faixa)
+        self.fields = []
+        # (nome, início, fim, resolução, offset) para decode_columns
+        self.signals = []
+        layout = '<'
+        position = 0
+        for param_name, info in params.items():
+            start = info['start_byte']
+            end = start + info['length']
+            self.fields.append((param_name, start, end)
+                               + self._scaling(info['resolution'], info.get('offset', 0))
+                               + (info['unit'], info['range']))
+            self.signals.append((param_name, start, end, info['resolution'], info.get('offset', 0)))
+            if layout is None or start < position or info['length'] not in self.FORMATS:
+                layout = None
+                continue
+            layout += 'x' * (start - position) + self.FORMATS[info['length']]
+            position = end
+        self.layout = struct.Struct(layout) if layout else None
+        self.size = self.layout.size if self.layout else 0
+    
+    @staticmethod
+    def _scaling(resolution, offset):
+        """(tipo, escala, offset) equivalente a round(v * resolution + offset, 2)"""
+        if isinstance(resolution, int) and isinstance(offset, int):
+            return EXACT, resolution, offset
+        scale = Fraction(str(resolution)) * 100
+        offset_cents = Fraction(str(offset)) * 100
+        if scale.denominator == 1 and offset_cents.denominator == 1:
+            return CENTS, int(scale), int(offset_cents)
+        return ROUND, resolution, offset
+    
+    def decode(self, data):
+        if self.layout is not None and len(data) >= self.size:
+            if not isinstance(data, (bytes, bytearray, memoryview)):
+                data = bytes(data)
+            raw = self.layout.unpack_from(data)
+            fields = self.fields
+        else:
+            # Mensagens remontadas (TP) têm tamanho variável
+            raw = []
+            fields = []
+            for field in self.fields:
+                if field[2] <= len(data):
+                    raw.append(int.from_bytes(bytes(data[field[1]:field[2]]), 'little'))
+                    fields.append(field)
+        
+        values = {}
+        for (param_name, _, _, kind, scale, offset, unit, value_range), value in zip(fields, raw):
+            if kind == EXACT:
+                value = value * scale + offset
+            elif kind == CENTS:
+                value = (value * scale + offset) / 100
+            else:
+                value = round(value * scale + offset, 2)
+            values[param_name] = {'value': value, 'unit': unit, 'range': value_range}
+        return {'name': self.name, 'values': values}
+    
+    def decode_columns(self, block, lengths=None):
+        """(nome, coluna float64) de cada parâmetro para um bloco (M, W) uint8
+        
+        Valores com o byte mais significativo acima de 0xFA são NaN
+        (J1939-71: 0xFB-0xFD reservado, 0xFE erro, 0xFF não disponível).
+        """
+        columns = []
+        for param_name, start, end, resolution, offset in self.signals:
+            if end > block.shape[1]:
+                columns.append((param_name, np.full(len(block), np.nan)))
+                continue
+            raw = block[:, start].astype(np.uint64)
+            for i in range(1, end - start):
+                raw |= block[:, start + i].astype(np.uint64) << np.uint64(8 * i)
+            valid = block[:, end - 1] <= 0xFA
+            if lengths is not None:
+                valid &= lengths >= end
+            values = raw.astype(np.float64) * resolution + offset
+            columns.append((param_name, np.where(valid, values, np.nan)))
+        return columns
+
+
+# Extratores compilados uma vez a partir do PGN_DICT
+EXTRACTORS = {pgn: PGNExtractor(info['name'], info['params'])
+              for pgn, info in J1939Decoder.PGN_DICT.items()}